@@ -0,0 +1,329 @@
+"""Stateless HTTP API for generating, validating and rendering flowcharts.
+
+Run with: uvicorn api:app --host 0.0.0.0 --port 8000
+
+POST /generate  {"description": ..., "stream": false}
+POST /render    {"dot_code": ..., "format": "png", "dpi": EXPORT_DPI, "persist": false}
+POST /validate  {"dot_code": ...}
+GET  /artifacts/{digest}  (supports Range requests)
+GET  /healthz, GET /metrics
+
+No state is kept between requests beyond the shared prompt and render
+caches, so instances can be scaled horizontally.
+"""
+import asyncio
+import json
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from functools import lru_cache
+from typing import Optional
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from cache import render_key
+from config import getenv
+from dotparse import DotSyntaxError, parse_dot, repair_dot
+from exporter import get_artifact_store, get_export_dpi, render_artifact, render_bytes
+from flowchart import Generation, agenerate_dot_code, astream_dot_code
+from metrics import counter, render_prometheus
+from workers import GraphvizError
+
+MEDIA_TYPES = {
+    "png": "image/png",
+    "pdf": "application/pdf",
+    "svg": "image/svg+xml",
+}
+ARTIFACT_MEDIA_TYPES = {**MEDIA_TYPES, "dot": "text/vnd.graphviz"}
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_DIGEST_RE = re.compile(r"[0-9a-f]{64}")
+_RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+REJECTED = counter("api_rejected_total", "API requests rejected with 503 by backpressure limits")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str, headers: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers
+
+
+class Limiter:
+    """Caps concurrent work; callers wait up to ``queue_timeout`` seconds, then get a 503."""
+
+    def __init__(self, name: str, limit: int, queue_timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._semaphore = None
+
+    async def acquire(self) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            REJECTED.inc(endpoint=self.name)
+            raise HTTPError(503, f"Too many concurrent {self.name} requests",
+                            {"Retry-After": str(max(1, round(self.queue_timeout)))}) from None
+
+    def release(self) -> None:
+        self._semaphore.release()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+class _LimitedStreamingResponse(StreamingResponse):
+    """Streaming response holding a Limiter slot until it is done being sent.
+
+    Released here rather than in the body generator, whose ``finally`` never
+    runs when the client disconnects before the body is iterated.
+    """
+
+    def __init__(self, limiter: Limiter, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+
+@lru_cache(maxsize=None)
+def get_limiter(name: str) -> Limiter:
+    return Limiter(
+        name,
+        int(getenv(f"API_MAX_{name.upper()}S", 8 if name == "generate" else 16)),
+        float(getenv("API_QUEUE_TIMEOUT", 5)),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_executor() -> ThreadPoolExecutor:
+    """Threads running blocking Graphviz work off the event loop."""
+    return ThreadPoolExecutor(max_workers=int(getenv("API_RENDER_WORKERS", 0)) or None,
+                              thread_name_prefix="api-render")
+
+
+async def _json_body(request: Request) -> dict:
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPError(400, "Request body must be JSON") from None
+    if not isinstance(body, dict):
+        raise HTTPError(400, "Request body must be a JSON object")
+    return body
+
+
+def _required_text(body: dict, name: str) -> str:
+    value = body.get(name)
+    if not isinstance(value, str) or not value.strip():
+        raise HTTPError(400, f"'{name}' must be a non-empty string")
+    return value
+
+
+def _generation_json(generation: Generation) -> dict:
+    return {k: v for k, v in asdict(generation).items() if k != "started_at"}
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match", "")
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+
+async def generate(request: Request) -> Response:
+    body = await _json_body(request)
+    description = _required_text(body, "description")
+    limiter = get_limiter("generate")
+    if not body.get("stream"):
+        async with limiter:
+            generation = Generation()
+            await agenerate_dot_code(description, generation)
+        return JSONResponse(_generation_json(generation))
+
+    # Newline-delimited JSON: {"fragment": ...} lines, then {"generation": ...};
+    # the slot is held until the stream ends so the limit covers the LLM call
+    await limiter.acquire()
+
+    async def lines():
+        try:
+            generation = Generation()
+            async for fragment in astream_dot_code(description, generation):
+                yield json.dumps({"fragment": fragment}) + "\n"
+            yield json.dumps({"generation": _generation_json(generation)}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"{type(e).__name__}: {e}"}) + "\n"
+
+    return _LimitedStreamingResponse(limiter, lines(), media_type="application/x-ndjson")
+
+
+async def render(request: Request) -> Response:
+    body = await _json_body(request)
+    dot_code = _required_text(body, "dot_code")
+    fmt = body.get("format", "png")
+    if not isinstance(fmt, str) or fmt not in MEDIA_TYPES:
+        raise HTTPError(400, f"'format' must be one of {', '.join(MEDIA_TYPES)}")
+    try:
+        dpi = body.get("dpi") or get_export_dpi()
+        if isinstance(dpi, bool) or not isinstance(dpi, (int, float, str)):
+            raise TypeError(dpi)
+        dpi = int(dpi)
+    except (TypeError, ValueError):
+        raise HTTPError(400, "'dpi' must be an integer") from None
+    if not 24 <= dpi <= 1200:
+        raise HTTPError(400, "'dpi' must be between 24 and 1200")
+
+    # Output is a pure function of the input, so its hash is a strong ETag
+    etag = f'"{render_key(dot_code, fmt, dpi if fmt == "png" else None)}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        # Parsing a large chart takes milliseconds of CPU: keep it off the event loop
+        await run_in_threadpool(parse_dot, dot_code)
+    except DotSyntaxError as e:
+        raise HTTPError(422, f"Invalid DOT code: {e}") from None
+    persist = bool(body.get("persist"))
+    if persist and get_artifact_store() is None:
+        raise HTTPError(400, "'persist' needs OUTPUT_DIR to be set on the server")
+    async with get_limiter("render"):
+        loop = asyncio.get_running_loop()
+        try:
+            if persist:
+                artifact = await loop.run_in_executor(get_executor(), render_artifact, dot_code, fmt, dpi)
+                data = await loop.run_in_executor(get_executor(), get_artifact_store().read, artifact.digest)
+                headers["X-Artifact-Digest"] = artifact.digest
+                headers["Content-Location"] = f"/artifacts/{artifact.digest}"
+            else:
+                data = await loop.run_in_executor(get_executor(), render_bytes, dot_code, fmt, dpi)
+        except TimeoutError as e:
+            raise HTTPError(504, str(e)) from None
+        except subprocess.CalledProcessError as e:
+            raise HTTPError(422, f"Graphviz failed: {_stderr(e)}") from None
+        except GraphvizError as e:
+            raise HTTPError(422, f"Graphviz failed: {e}") from None
+
+    async def chunks():
+        for start in range(0, len(data), STREAM_CHUNK_SIZE):
+            yield data[start:start + STREAM_CHUNK_SIZE]
+
+    headers["Content-Length"] = str(len(data))
+    return StreamingResponse(chunks(), media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+def _stderr(error: subprocess.CalledProcessError) -> str:
+    stderr = error.stderr or b""
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode("utf-8", errors="replace")
+    return stderr.strip() or f"exit status {error.returncode}"
+
+
+def _byte_range(header: str, size: int) -> Optional[tuple]:
+    """(start, end) for a single ``bytes=`` range, end exclusive; None when unsatisfiable."""
+    match = _RANGE_RE.fullmatch(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:  # suffix range: the last N bytes
+        return (max(0, size - int(last)), size) if int(last) else None
+    start = int(first)
+    end = min(size, int(last) + 1) if last else size
+    return (start, end) if start < end else None
+
+
+def _artifact_chunks(digest: str, start: int, end: int):
+    # A sync generator: Starlette iterates it in a worker thread
+    with get_artifact_store().open(digest) as f:
+        if start:
+            f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def artifact(request: Request) -> Response:
+    """Stored artifacts by SHA-256 of their (decompressed) content, with Range support."""
+    digest = request.path_params["digest"]
+    store = get_artifact_store()
+    info = None
+    if store is not None and _DIGEST_RE.fullmatch(digest):
+        info = await asyncio.get_running_loop().run_in_executor(get_executor(), store.info, digest)
+    if info is None:
+        raise HTTPError(404, "No such artifact")
+
+    # Stored gzip is sent as is (the client decompresses it) unless a range is
+    # requested; the two representations need distinct ETags
+    gzipped = ("range" not in request.headers and info.encoding == "gzip"
+               and "gzip" in request.headers.get("accept-encoding", ""))
+    headers = {"ETag": f'"{digest}-gzip"' if gzipped else f'"{digest}"', "Accept-Ranges": "bytes",
+               "Cache-Control": "public, max-age=31536000, immutable", "Vary": "Accept-Encoding"}
+    if _etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    media_type = ARTIFACT_MEDIA_TYPES.get(info.ext, "application/octet-stream")
+    start, end, status = 0, info.size, 200
+    if "range" in request.headers:
+        byte_range = _byte_range(request.headers["range"], info.size)
+        if byte_range is None:
+            raise HTTPError(416, "Range not satisfiable", {"Content-Range": f"bytes */{info.size}"})
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{info.size}"
+    elif gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return FileResponse(info.path, media_type=media_type, headers=headers)
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(_artifact_chunks(digest, start, end), status_code=status,
+                             media_type=media_type, headers=headers)
+
+
+async def validate(request: Request) -> Response:
+    body = await _json_body(request)
+    result = await run_in_threadpool(repair_dot, _required_text(body, "dot_code"))
+    return JSONResponse({
+        "valid": not result.fixes and result.ok,
+        "repaired": result.dot if result.ok and result.fixes else None,
+        "fixes": result.fixes,
+        "error": result.error,
+    })
+
+
+async def healthz(request: Request) -> Response:
+    return PlainTextResponse("ok")
+
+
+async def metrics(request: Request) -> Response:
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+async def _http_error(request: Request, exc: HTTPError) -> Response:
+    return JSONResponse({"error": str(exc)}, status_code=exc.status, headers=exc.headers)
+
+
+app = Starlette(
+    routes=[
+        Route("/generate", generate, methods=["POST"]),
+        Route("/render", render, methods=["POST"]),
+        Route("/validate", validate, methods=["POST"]),
+        Route("/artifacts/{digest}", artifact),
+        Route("/healthz", healthz),
+        Route("/metrics", metrics),
+    ],
+    exception_handlers={HTTPError: _http_error},
+)
@@ -1,7 +1,59 @@
-import streamlit as st
-from flowchart import generate_dot_code
-from exporter import save_dot_file, render_dot
 import time
+import hashlib
+import textwrap
+import uuid
+import streamlit as st
+from flowchart import Generation, stream_dot_code
+from exporter import (get_export_dpi, get_janitor, get_output_dir, prefetch, render_formats, render_preview,
+                      save_dot_file, save_render)
+from history import get_history
+from llm_backends import get_backend_name, get_model_name
+from dotgraph import diff_graphs
+from dotparse import DotSyntaxError, parse_dot
+from large_graph import is_large, split_stages
+from functools import partial
+from metrics import histogram, start_exporter
+from config import getenv
+
+# With API_URL set, generation and rendering happen in the HTTP service (api.py)
+if getenv("API_URL"):
+    from client import prefetch, render_formats, render_preview, stream_dot_code
+
+run_started = time.perf_counter()
+SCRIPT_RUN_SECONDS = histogram("app_script_run_seconds", "Duration of Streamlit script runs that completed")
+
+EXPORT_FORMATS = ("png", "pdf", "svg")
+DPI_OPTIONS = sorted({96, 150, 200, 300, 600, get_export_dpi()})
+
+def export_bytes(dot_code: str, fmt: str, dpi: int, history_token=None) -> bytes:
+    data = render_formats(dot_code, EXPORT_FORMATS, dpi)[fmt]
+    if history_token is not None and get_output_dir():
+        # Only the downloaded format is stored, and its hash recorded so it can be fetched again
+        get_history().update(history_token, artifacts={fmt: save_render(dot_code, fmt, data, dpi).digest})
+    return data
+
+def dot_artifacts(dot_code: str) -> dict:
+    """Artifact hash of DOT code stored in OUTPUT_DIR; nothing is recorded when it is not set."""
+    if not get_output_dir():
+        return {}
+    save_dot_file(dot_code)
+    return {"dot": hashlib.sha256(dot_code.encode("utf-8")).hexdigest()}
+
+def history_owner() -> str:
+    """Whose charts the history shows: the signed-in user when Streamlit
+    authentication is configured, otherwise this browser session."""
+    if st.user.get("is_logged_in") and st.user.get("email"):
+        return f"user:{st.user.email}"
+    return f"session:{st.session_state.session_id}"
+
+def open_chart(entry) -> None:
+    """Show a chart from the history, without generating it again."""
+    st.session_state.flowchart_generated = True
+    st.session_state.current_dot_code = entry.dot_code
+    st.session_state.current_prompt = entry.prompt
+    st.session_state.history_token = entry.token
+    st.session_state.pop("example_text", None)
+    st.query_params["chart"] = entry.token
 
 # Page configuration
 st.set_page_config(
@@ -73,6 +125,12 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Expire old outputs in the background for the lifetime of the server
+if get_output_dir():
+    get_janitor()
+# Process-wide metrics on METRICS_PORT and/or METRICS_FILE, if configured
+start_exporter()
+
 # Initialize session state
 if 'flowchart_generated' not in st.session_state:
     st.session_state.flowchart_generated = False
@@ -80,6 +138,15 @@ if 'generation_count' not in st.session_state:
     st.session_state.generation_count = 0
 if 'total_chars' not in st.session_state:
     st.session_state.total_chars = 0
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# A ?chart=<token> link reopens a chart from the history, e.g. after the session dropped
+chart_param = st.query_params.get("chart")
+if chart_param and st.session_state.get("history_token") != chart_param:
+    entry = get_history().get(chart_param)
+    if entry is not None:
+        open_chart(entry)
 
 # Header
 st.markdown("""
@@ -128,6 +195,21 @@ with st.sidebar:
     
     st.markdown("---")
     
+    # Past charts of this user (or session); reopening one makes no LLM call
+    st.subheader("🕘 History")
+    history_query = st.text_input("Search past charts", key="history_query", placeholder="e.g. login")
+    history = get_history()
+    owner = history_owner()
+    entries = history.search(history_query, limit=8, session=owner) if history_query else history.recent(8, owner)
+    for entry in entries:
+        if st.button(textwrap.shorten(entry.prompt, 40, placeholder="…"), key=f"history_{entry.token}",
+                     help=time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.created_at)),
+                     use_container_width=True):
+            open_chart(entry)
+            st.rerun()
+    
+    st.markdown("---")
+    
     # Tips
     st.markdown("""
     <div class="info-card">
@@ -189,6 +271,8 @@ with col1:
     # Character count display
     color = "🔴" if char_count > max_chars * 0.9 else "🟡" if char_count > max_chars * 0.7 else "🟢"
     st.caption(f"{color} {char_count}/{max_chars} characters")
+    if prompt and is_large(prompt):
+        st.caption(f"🧩 Large workflow: generated as {len(split_stages(prompt))} stages in parallel")
     if prompt:
         st.session_state.current_prompt = prompt
     # Generate button
@@ -204,25 +288,29 @@ with col1:
         else:
             # Show loading state
             with st.spinner("🔄 Generating your flowchart..."):
-                progress_bar = st.progress(0)
                 status_text = st.empty()
-                
-                # Progress simulation
-                for i in range(0, 101, 5):
-                    progress_bar.progress(i)
-                    if i < 30:
-                        status_text.text("🤖 Analyzing description...")
-                    elif i < 60:
-                        status_text.text("🎨 Creating flowchart...")
-                    elif i < 90:
-                        status_text.text("⚙️ Generating code...")
-                    else:
-                        status_text.text("✨ Finalizing...")
-                    time.sleep(0.1)
+                code_preview = st.empty()
+                status_text.text("🤖 Analyzing description...")
                 
                 try:
-                    # Generate flowchart using your existing function
-                    dot_code = generate_dot_code(prompt)
+                    # Stream the DOT code and show it as it arrives
+                    fragments = []
+                    generation = Generation()
+                    for fragment in stream_dot_code(prompt, generation):
+                        fragments.append(fragment)
+                        partial_code = "".join(fragments)
+                        status_text.text(
+                            f"⚙️ Generating code... {len(fragments)} chunks, {len(partial_code)} characters received"
+                        )
+                        code_preview.code(partial_code, language="dot")
+                    # Validated (and if needed repaired) code
+                    dot_code = generation.dot_code
+                    if generation.error is not None:
+                        # Neither the local repair nor asking the model again produced valid
+                        # DOT: the streamed code stays on screen, but isn't shown or saved
+                        status_text.empty()
+                        raise DotSyntaxError(f"The generated code is not valid DOT and could not be "
+                                             f"repaired: {generation.error}")
                     
                     # Update session state
                     st.session_state.flowchart_generated = True
@@ -230,21 +318,22 @@ with col1:
                     st.session_state.total_chars += char_count
                     st.session_state.current_dot_code = dot_code
                     st.session_state.current_prompt = prompt
+                    st.session_state.history_token = get_history().add(
+                        prompt, dot_code, model=f"{get_backend_name()}:{get_model_name()}",
+                        generation=generation, artifacts=dot_artifacts(dot_code),
+                        session=history_owner(),
+                    )
+                    st.query_params["chart"] = st.session_state.history_token
                     
-                    # Success message
-                    progress_bar.progress(100)
-                    status_text.text("✅ Success!")
-                    
-                    st.markdown("""
-                    <div class="success-msg">
-                        🎉 Flowchart generated successfully! Check the preview and download options →
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    time.sleep(1)
-                    progress_bar.empty()
-                    status_text.empty()
-                    
+                    # Success message survives the rerun below
+                    st.toast("🎉 Flowchart generated successfully! Check the preview and download options →")
+                    if generation.repairs:
+                        st.toast(f"🛠️ Fixed {len(generation.repairs)} issue(s) in the generated code")
+                    if not generation.cached:
+                        st.toast(
+                            f"📊 {generation.prompt_tokens} prompt + {generation.completion_tokens} completion tokens, "
+                            f"first token after {generation.ttft or 0:.1f}s, {generation.total_time:.1f}s total"
+                        )
                     st.rerun()
                     
                 except Exception as e:
@@ -263,8 +352,19 @@ with col2:
         
         with tab1:
             st.markdown("**Flowchart Preview:**")
+            # A quick SVG (or low-DPI PNG) render; its layout is cached for the exports
+            try:
+                preview_format, preview = render_preview(st.session_state.current_dot_code)
+            except Exception:
+                preview = None
             try:
-                st.graphviz_chart(st.session_state.current_dot_code)
+                if preview is None:
+                    # No Graphviz here or the render failed: let the browser draw it
+                    st.graphviz_chart(st.session_state.current_dot_code)
+                elif preview_format == "svg":
+                    st.image(preview.decode("utf-8"))
+                else:
+                    st.image(preview)
             except Exception as e:
                 st.error(f"Preview error: {e}")
         
@@ -279,9 +379,27 @@ with col2:
             )
             update_clicked = st.button("🔄 Update Flowchart", key="update_flowchart_btn")
             if update_clicked:
-                st.session_state.current_dot_code = edited_dot_code
-                st.success("Flowchart updated! Preview and downloads will use your changes.")
-                st.rerun()
+                try:
+                    edited_graph = parse_dot(edited_dot_code)
+                except DotSyntaxError as e:
+                    st.error(f"Invalid DOT code: {e}")
+                else:
+                    try:
+                        change = diff_graphs(parse_dot(st.session_state.current_dot_code), edited_graph)
+                    except DotSyntaxError:
+                        change = None
+                    if change is not None and not change:
+                        st.info("No changes to the flowchart.")
+                    else:
+                        st.session_state.current_dot_code = edited_dot_code
+                        if st.session_state.get("history_token") is not None:
+                            get_history().update(st.session_state.history_token, dot_code=edited_dot_code,
+                                                 artifacts=dot_artifacts(edited_dot_code))
+                        summary = change.summary() if change is not None else "new code"
+                        if change is not None and not change.layout_changed:
+                            summary += ", layout reused"
+                        st.toast(f"🔄 Flowchart updated ({summary}). Preview and downloads will use your changes.")
+                        st.rerun()
             st.code(st.session_state.current_dot_code, language='dot')
             if st.button("📋 Copy Code"):
                 st.success("Code ready to copy!")
@@ -297,46 +415,63 @@ with col2:
             </div>
             """, unsafe_allow_html=True)
             
+            dot_code = st.session_state.current_dot_code
+            dpi = st.select_slider("PNG resolution (DPI)", options=DPI_OPTIONS, value=get_export_dpi(),
+                                   key="export_dpi")
             try:
-                # Generate files using your existing functions
-                png_file = render_dot(st.session_state.current_dot_code, "png")
-                pdf_file = render_dot(st.session_state.current_dot_code, "pdf")
-                
-                col_a, col_b = st.columns(2)
-                
-                with col_a:
-                    with open(png_file, "rb") as f:
-                        st.download_button(
-                            "🖼️ PNG Image",
-                            f,
-                            file_name="flowchart.png",
-                            mime="image/png",
-                            use_container_width=True
-                        )
-                
-                with col_b:
-                    with open(pdf_file, "rb") as f:
-                        st.download_button(
-                            "📄 PDF Document",
-                            f,
-                            file_name="flowchart.pdf",
-                            mime="application/pdf",
-                            use_container_width=True
-                        )
-                
-                # DOT file
-                dot_file = save_dot_file(st.session_state.current_dot_code)
-                with open(dot_file, "rb") as f:
-                    st.download_button(
-                        "📝 DOT Source Code",
-                        f,
-                        file_name="flowchart.dot",
-                        mime="text/plain",
-                        use_container_width=True
-                    )
-                        
+                # Exports render in the background, all formats from one Graphviz layout,
+                # once per chart version, so they are usually cached by the time a button is clicked
+                version = (dot_code, dpi)
+                if st.session_state.get("export_prefetch", (None,))[0] != version:
+                    st.session_state.export_prefetch = (version, prefetch(dot_code, EXPORT_FORMATS, dpi))
+                future = st.session_state.export_prefetch[1]
+                if future.done() and future.exception() is not None:
+                    # Shown once; the next rerun tries again
+                    del st.session_state.export_prefetch
+                    raise future.exception()
             except Exception as e:
                 st.error(f"Download preparation error: {e}")
+            col_a, col_b, col_c = st.columns(3)
+            
+            with col_a:
+                st.download_button(
+                    "🖼️ PNG Image",
+                    partial(export_bytes, dot_code, "png", dpi, st.session_state.get("history_token")),
+                    file_name="flowchart.png",
+                    mime="image/png",
+                    on_click="ignore",
+                    use_container_width=True
+                )
+            
+            with col_b:
+                st.download_button(
+                    "📄 PDF Document",
+                    partial(export_bytes, dot_code, "pdf", dpi, st.session_state.get("history_token")),
+                    file_name="flowchart.pdf",
+                    mime="application/pdf",
+                    on_click="ignore",
+                    use_container_width=True
+                )
+            
+            with col_c:
+                st.download_button(
+                    "🧩 SVG Vector",
+                    partial(export_bytes, dot_code, "svg", dpi, st.session_state.get("history_token")),
+                    file_name="flowchart.svg",
+                    mime="image/svg+xml",
+                    on_click="ignore",
+                    use_container_width=True
+                )
+            
+            # DOT file
+            st.download_button(
+                "📝 DOT Source Code",
+                dot_code,
+                file_name="flowchart.dot",
+                mime="text/plain",
+                on_click="ignore",
+                use_container_width=True
+            )
     
     else:
         # Placeholder
@@ -408,3 +543,5 @@ with col_f3:
     </div>
     """.format(st.session_state.generation_count, st.session_state.total_chars), unsafe_allow_html=True)
 
+# Runs cut short by st.rerun() are not observed
+SCRIPT_RUN_SECONDS.observe(time.perf_counter() - run_started)
@@ -0,0 +1,264 @@
+import gzip
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import BinaryIO, NamedTuple, Optional
+
+# Text formats compress well; PNG and PDF already are compressed
+COMPRESSIBLE = {"dot", "svg"}
+SUFFIXES = {"identity": "", "gzip": ".gz", "zstd": ".zst"}
+
+_ARTIFACT_NAME_RE = re.compile(r"[0-9a-f]{64}\.\w+(\.gz|\.zst)?")
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+class Artifact(NamedTuple):
+    digest: str
+    ext: str
+    size: int
+    stored_size: int
+    encoding: str
+    refs: int
+    path: str
+
+
+class ArtifactStore:
+    """Content-addressed files: each unique byte string is stored once, named
+    ``<sha256>.<ext>`` after its content.
+
+    DOT and SVG are compressed (zstd when the ``zstandard`` package is
+    installed, otherwise gzip) and decompressed transparently on reads,
+    including range reads. Names such as a render cache key point at an
+    artifact; ``release`` drops a name and deletes the artifact once no other
+    name points at it. Otherwise files live until the OutputJanitor expires
+    them by age or size, which also forgets their names. Names and sizes
+    live in an SQLite index under ``<directory>/.artifacts``.
+    """
+
+    def __init__(self, directory: str, compression: str = "auto"):
+        if compression == "auto":
+            compression = "zstd" if _zstandard() else "gzip"
+        if compression == "none":
+            compression = "identity"
+        if compression not in SUFFIXES:
+            raise ValueError(f"Unknown artifact compression {compression!r}")
+        if compression == "zstd" and _zstandard() is None:
+            raise RuntimeError("zstd artifact compression requires the zstandard package")
+        self.directory = directory
+        self.compression = compression
+        self.writes = 0
+        self.dedup_hits = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def path(self, digest: str, ext: str, encoding: str) -> str:
+        return os.path.join(self.directory, f"{digest}.{ext}{SUFFIXES[encoding]}")
+
+    def put(self, data: bytes, ext: str, name: Optional[str] = None, compress: bool = True) -> Artifact:
+        """Store ``data`` unless identical bytes are stored already; ``name`` becomes a reference to it.
+
+        With ``compress=False`` the file at the returned path is the data
+        itself, readable without the store; a compressed copy stored earlier
+        is replaced by an uncompressed one.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            conn = self._connect()
+            artifact = self._info(conn, digest)
+            if artifact is None or (not compress and artifact.encoding != "identity"):
+                encoding, payload = self._encode(data, ext) if compress else ("identity", data)
+                path = self.path(digest, ext, encoding)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+                # An upsert keeps the references of a re-encoded artifact
+                conn.execute(
+                    "INSERT INTO artifacts (digest, ext, size, stored_size, encoding, refs, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, 0, ?) ON CONFLICT (digest) DO UPDATE "
+                    "SET stored_size = excluded.stored_size, encoding = excluded.encoding",
+                    (digest, ext, len(data), len(payload), encoding, time.time()),
+                )
+                if artifact is not None:
+                    os.remove(artifact.path)
+                self.writes += 1
+            else:
+                self.dedup_hits += 1
+            if name is not None:
+                self._link(conn, name, digest)
+            conn.commit()
+            return self._info(conn, digest)
+
+    def resolve(self, name: str) -> Optional[Artifact]:
+        """The artifact a name refers to, if it still exists."""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT digest FROM names WHERE name = ?", (name,)).fetchone()
+            return self._info(conn, row[0]) if row else None
+
+    def info(self, digest: str) -> Optional[Artifact]:
+        with self._lock:
+            return self._info(self._connect(), digest)
+
+    def release(self, name: str) -> None:
+        """Drop a name; the artifact is deleted once no name refers to it."""
+        with self._lock:
+            conn = self._connect()
+            self._unlink(conn, name)
+            conn.commit()
+
+    def open(self, digest: str) -> BinaryIO:
+        """Decompressed content as a binary file object (forward seeks only when compressed)."""
+        artifact = self.info(digest)
+        if artifact is None:
+            raise KeyError(digest)
+        if artifact.encoding == "gzip":
+            return gzip.open(artifact.path, "rb")
+        if artifact.encoding == "zstd":
+            return _zstandard().ZstdDecompressor().stream_reader(open(artifact.path, "rb"), closefd=True)
+        return open(artifact.path, "rb")
+
+    def read(self, digest: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Content bytes ``[start, end)``; the whole artifact by default."""
+        with self.open(digest) as f:
+            if start:
+                f.seek(start)
+            return f.read() if end is None else f.read(max(0, end - start))
+
+    def discard(self, paths: list) -> None:
+        """Forget artifacts whose files were deleted by someone else, e.g. the janitor."""
+        with self._lock:
+            conn = self._connect()
+            digests = []
+            for path in paths:
+                digest = os.path.basename(path).split(".", 1)[0]
+                row = conn.execute("SELECT ext, encoding FROM artifacts WHERE digest = ?", (digest,)).fetchone()
+                # A path from before the artifact was stored again uncompressed is not its file any more
+                if row is None or os.path.basename(self.path(digest, *row)) == os.path.basename(path):
+                    digests.append(digest)
+            conn.executemany("DELETE FROM names WHERE digest = ?", [(d,) for d in digests])
+            conn.executemany("DELETE FROM artifacts WHERE digest = ?", [(d,) for d in digests])
+            conn.commit()
+
+    def migrate(self) -> int:
+        """Move files written before the store (one per export, extensionless
+        files being DOT sources) into it, deduplicated; returns the number moved."""
+        moved = 0
+        with os.scandir(self.directory) as entries:
+            legacy = [e for e in entries if e.is_file() and not _ARTIFACT_NAME_RE.fullmatch(e.name)
+                      and not e.name.endswith(".tmp")]
+        for entry in legacy:
+            ext = os.path.splitext(entry.name)[1].lstrip(".") or "dot"
+            with open(entry.path, "rb") as f:
+                self.put(f.read(), ext, name=f"legacy:{entry.name}")
+            os.remove(entry.path)
+            moved += 1
+        return moved
+
+    def stats(self) -> dict:
+        with self._lock:
+            conn = self._connect()
+            artifacts, size, stored = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM artifacts").fetchone()
+            names = conn.execute("SELECT COUNT(*) FROM names").fetchone()[0]
+        return {"artifacts": artifacts, "names": names, "bytes": size, "stored_bytes": stored,
+                "writes": self.writes, "dedup_hits": self.dedup_hits}
+
+    def _encode(self, data: bytes, ext: str) -> tuple:
+        if ext not in COMPRESSIBLE or self.compression == "identity":
+            return "identity", data
+        if self.compression == "zstd":
+            payload = _zstandard().ZstdCompressor(level=10).compress(data)
+        else:
+            payload = gzip.compress(data, compresslevel=9, mtime=0)
+        # Tiny inputs can grow; store those as they are
+        return (self.compression, payload) if len(payload) < len(data) else ("identity", data)
+
+    def _info(self, conn, digest: str) -> Optional[Artifact]:
+        row = conn.execute(
+            "SELECT digest, ext, size, stored_size, encoding, refs FROM artifacts WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row is None:
+            return None
+        artifact = Artifact(*row, path=self.path(row[0], row[1], row[4]))
+        if not os.path.exists(artifact.path):
+            # Deleted behind our back: drop it, so the next put stores it again
+            conn.execute("DELETE FROM names WHERE digest = ?", (digest,))
+            conn.execute("DELETE FROM artifacts WHERE digest = ?", (digest,))
+            conn.commit()
+            return None
+        return artifact
+
+    def _link(self, conn, name: str, digest: str) -> None:
+        row = conn.execute("SELECT digest FROM names WHERE name = ?", (name,)).fetchone()
+        if row and row[0] == digest:
+            return
+        if row:
+            self._unlink(conn, name)
+        conn.execute("INSERT INTO names (name, digest, linked_at) VALUES (?, ?, ?)", (name, digest, time.time()))
+        conn.execute("UPDATE artifacts SET refs = refs + 1 WHERE digest = ?", (digest,))
+
+    def _unlink(self, conn, name: str) -> None:
+        row = conn.execute("SELECT digest FROM names WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return
+        digest = row[0]
+        conn.execute("DELETE FROM names WHERE name = ?", (name,))
+        conn.execute("UPDATE artifacts SET refs = refs - 1 WHERE digest = ?", (digest,))
+        row = conn.execute("SELECT ext, encoding, refs FROM artifacts WHERE digest = ?", (digest,)).fetchone()
+        if row and row[2] <= 0:
+            conn.execute("DELETE FROM artifacts WHERE digest = ?", (digest,))
+            try:
+                os.remove(self.path(digest, row[0], row[1]))
+            except OSError:
+                pass
+
+    def _connect(self):
+        if self._conn is None:
+            index_dir = os.path.join(self.directory, ".artifacts")
+            os.makedirs(index_dir, exist_ok=True)
+            conn = sqlite3.connect(os.path.join(index_dir, "index.sqlite3"), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    digest TEXT PRIMARY KEY,
+                    ext TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    encoding TEXT NOT NULL,
+                    refs INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS names (
+                    name TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    linked_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS names_digest ON names (digest);
+            """)
+            self._conn = conn
+        return self._conn
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Move pre-existing output files into the artifact store.")
+    parser.add_argument("directory", help="e.g. the OUTPUT_DIR")
+    parser.add_argument("--compression", default="auto", choices=["auto", "zstd", "gzip", "none"])
+    args = parser.parse_args()
+    store = ArtifactStore(args.directory, args.compression)
+    moved = store.migrate()
+    stats = store.stats()
+    print(f"Moved {moved} files into {stats['artifacts']} artifacts "
+          f"({stats['bytes']} bytes, {stats['stored_bytes']} on disk)")
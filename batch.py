@@ -0,0 +1,249 @@
+"""Generate and render flowcharts for many descriptions at once.
+
+Usage: python batch.py descriptions.jsonl --out-dir charts --formats png pdf
+
+Each input line is either a JSON string or an object with a "description"
+and an optional "id" used for the output file names.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from flowchart import Generation, agenerate_dot_code
+from exporter import render_formats
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "InternalServerError", "DeadlineExceeded", "ServerError",
+}
+
+
+class TokenBucket:
+    """Async token bucket allowing ``rate`` acquisitions per second with bursts up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class BatchResult:
+    index: int
+    description: str
+    dot_code: Optional[str] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    files: list = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    ttft: Optional[float] = None
+    total_time: Optional[float] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        for attr in ("status_code", "code", "status"):
+            value = getattr(exc, attr, None)
+            if isinstance(value, int):
+                return value
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether an LLM error is a rate limit or transient server failure."""
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if type(exc).__name__ in RETRYABLE_ERRORS:
+        return True
+    return bool(re.search(r"\b(429|50[0234])\b|RESOURCE_EXHAUSTED|UNAVAILABLE", str(exc)))
+
+
+async def _generate_one(index: int, description: str, semaphore: asyncio.Semaphore,
+                        bucket: Optional[TokenBucket], max_retries: int,
+                        base_delay: float, max_delay: float) -> BatchResult:
+    result = BatchResult(index, description)
+    while True:
+        result.attempts += 1
+        async with semaphore:
+            if bucket is not None:
+                await bucket.acquire()
+            try:
+                generation = Generation()
+                result.dot_code = await agenerate_dot_code(description, generation)
+                result.prompt_tokens, result.completion_tokens = generation.prompt_tokens, generation.completion_tokens
+                result.ttft, result.total_time = generation.ttft, generation.total_time
+                if generation.error is not None:
+                    result.error = f"DotSyntaxError: {generation.error}"
+                return result
+            except Exception as e:
+                if result.attempts > max_retries or not is_retryable(e):
+                    result.error = f"{type(e).__name__}: {e}"
+                    return result
+        # Full jitter keeps retries from many items from synchronizing; the
+        # slot is released meanwhile so other items can run
+        await asyncio.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** (result.attempts - 1))))
+
+
+async def generate_batch(descriptions: list, concurrency: int = 8, rate: Optional[float] = None,
+                         burst: Optional[float] = None, max_retries: int = 4,
+                         base_delay: float = 1.0, max_delay: float = 30.0) -> list:
+    """Generate DOT code for every description, returning results in input order.
+
+    At most ``concurrency`` requests are in flight and, when ``rate`` is set,
+    no more than ``rate`` requests per second are started. Rate-limit and
+    server errors are retried with jittered exponential backoff; other
+    failures are reported on the item's ``error``.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate, burst) if rate else None
+    return list(await asyncio.gather(*(
+        _generate_one(i, description, semaphore, bucket, max_retries, base_delay, max_delay)
+        for i, description in enumerate(descriptions)
+    )))
+
+
+def _parse_item(line: str) -> dict:
+    item = json.loads(line)
+    if isinstance(item, str):
+        item = {"description": item}
+    if not isinstance(item, dict):
+        raise ValueError(f"expected a string or an object, got {type(item).__name__}")
+    if not isinstance(item.get("description"), str) or not item["description"].strip():
+        raise ValueError("'description' must be a non-empty string")
+    return item
+
+
+def _read_jsonl(path: str) -> list:
+    """Items of a JSONL file; a line that is not a valid item is kept as the
+    ValueError describing it, so it fails on its own instead of the batch."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                items.append(_parse_item(line))
+            except ValueError as e:
+                items.append(ValueError(f"line {number}: {e}"))
+    return items
+
+
+def _output_names(items: list) -> list:
+    """File name stem of each item (its id, else its index); an item reusing
+    another's name gets a ValueError instead, as its files would overwrite."""
+    names, seen = [], {}
+    for i, item in enumerate(items):
+        item_id = item.get("id", i) if isinstance(item, dict) else i
+        name = re.sub(r"[^\w.-]", "_", str(item_id))
+        if name in seen:
+            names.append(ValueError(f"duplicate id {str(item_id)!r} (output name of item #{seen[name]})"))
+        else:
+            seen[name] = i
+            names.append(name)
+    return names
+
+
+def _write_outputs(result: BatchResult, name: str, out_dir: str, formats: list, dpi: int) -> list:
+    files = [os.path.join(out_dir, f"{name}.dot")]
+    with open(files[0], "w", encoding="utf-8") as f:
+        f.write(result.dot_code)
+    # All formats share one Graphviz layout
+    for fmt, data in render_formats(result.dot_code, formats, dpi).items():
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        with open(path, "wb") as f:
+            f.write(data)
+        files.append(path)
+    return files
+
+
+async def run(input_path: str, out_dir: str, formats: list, dpi: int, concurrency: int,
+              rate: Optional[float], render_workers: int, max_retries: int) -> list:
+    items = _read_jsonl(input_path)
+    names = _output_names(items)
+    os.makedirs(out_dir, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate) if rate else None
+
+    with ThreadPoolExecutor(max_workers=render_workers) as executor:
+        async def process(i: int, item) -> BatchResult:
+            for invalid in (item, names[i]):
+                if isinstance(invalid, ValueError):
+                    return BatchResult(i, item.get("description", "") if isinstance(item, dict) else "",
+                                       error=f"ValueError: {invalid}")
+            result = await _generate_one(i, item["description"], semaphore, bucket, max_retries, 1.0, 30.0)
+            if result.ok:
+                # Rendering starts as soon as each chart is generated
+                try:
+                    result.files = await loop.run_in_executor(
+                        executor, _write_outputs, result, names[i], out_dir, formats, dpi)
+                except Exception as e:
+                    result.error = f"{type(e).__name__}: {e}"
+            return result
+
+        results = await asyncio.gather(*(process(i, item) for i, item in enumerate(items)))
+
+    with open(os.path.join(out_dir, "results.jsonl"), "w", encoding="utf-8") as f:
+        for name, result in zip(names, results):
+            f.write(json.dumps({
+                "index": result.index, "id": None if isinstance(name, ValueError) else name, "ok": result.ok, "error": result.error,
+                "attempts": result.attempts, "files": result.files,
+                "prompt_tokens": result.prompt_tokens, "completion_tokens": result.completion_tokens,
+                "ttft": result.ttft, "total_time": result.total_time,
+            }) + "\n")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate flowcharts for a JSONL file of descriptions.")
+    parser.add_argument("input", help="JSONL file of descriptions")
+    parser.add_argument("--out-dir", default="batch_outputs")
+    parser.add_argument("--formats", nargs="+", default=["png", "pdf"])
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8, help="LLM requests in flight")
+    parser.add_argument("--rate", type=float, default=None, help="LLM requests started per second")
+    parser.add_argument("--render-workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--max-retries", type=int, default=4)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.input, args.out_dir, args.formats, args.dpi, args.concurrency,
+                              args.rate, args.render_workers, args.max_retries))
+    failed = [r for r in results if not r.ok]
+    print(f"{len(results) - len(failed)}/{len(results)} flowcharts written to {args.out_dir}")
+    for result in failed:
+        print(f"  #{result.index}: {result.error}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Enforce the import-time budget of the library modules.
+
+Usage: python benchmarks/import_time.py [--budget-ms 100] [--runs 5]
+
+Imports flowchart and exporter in fresh interpreters under
+``python -X importtime`` and exits non-zero when the best cumulative import
+time exceeds the budget, when a heavy dependency is imported eagerly, or
+when importing creates OUTPUT_DIR.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["flowchart", "exporter"]
+# Dependencies that must only be imported when first used
+DEFERRED = ("langchain", "langchain_core", "langchain_google_genai", "google", "graphviz", "dotenv")
+
+
+def import_times(output_dir: str) -> tuple:
+    code = f"import sys, {', '.join(MODULES)}; print(' '.join(sorted(sys.modules)))"
+    env = dict(os.environ, OUTPUT_DIR=output_dir, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    times = {}
+    for line in proc.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\S+)$", line)
+        if match and match.group(2) in MODULES:
+            times[match.group(2)] = int(match.group(1)) / 1000
+    return times, set(proc.stdout.split())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=100.0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = os.path.join(tmp, "outputs")
+        runs = [import_times(output_dir) for _ in range(args.runs)]
+        if os.path.exists(output_dir):
+            failures.append("importing created OUTPUT_DIR")
+
+    best = min(sum(times.values()) for times, _ in runs)
+    print(f"import {', '.join(MODULES)}: {best:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if best > args.budget_ms:
+        failures.append(f"import time {best:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+    eager = sorted(m for m in runs[0][1] if m.split(".")[0] in DEFERRED)
+    if eager:
+        failures.append(f"eagerly imported: {', '.join(eager)}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Drive concurrent sessions through generate_dot_code and render_dot.
+
+Usage: python benchmarks/loadtest.py [--sessions 16] [--requests 10] [--latency lognormal:1.2,0.5]
+
+Uses the local fake LLM backend unless --backend is given, so no API key
+or network is needed. Descriptions are unique per request so the prompt
+cache (exact or near-duplicate) does not answer them, unless --repeat is set.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DESCRIPTIONS = [
+    "A user uploads a CSV file. The backend validates the rows. Valid rows are stored in the database. "
+    "A summary report is exported as PDF.",
+    "Customer places an order. Payment is authorized. The warehouse picks and packs the items. "
+    "The parcel is shipped. The customer receives a tracking email.",
+    "A developer opens a pull request. CI runs the tests. A reviewer approves the change. "
+    "The branch is merged. The release pipeline deploys to production.",
+    "The user enters a process description in a web interface. The system uses an LLM to generate DOT code. "
+    "The DOT code is rendered as a flowchart. The user exports the flowchart as PNG or PDF.",
+]
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float("nan")
+
+
+def session(index: int, requests: int, formats: list, repeat: bool, timings: dict, errors: list,
+            lock: threading.Lock) -> None:
+    from exporter import render_dot
+    from flowchart import Generation, generate_dot_code
+
+    for n in range(requests):
+        description = DESCRIPTIONS[(index + n) % len(DESCRIPTIONS)]
+        if not repeat:
+            description += f" Session {index} request {n}."
+        start = time.perf_counter()
+        try:
+            generation = Generation()
+            dot_code = generate_dot_code(description, generation)
+            generated = time.perf_counter()
+            for fmt in formats:
+                render_dot(dot_code, fmt)
+            done = time.perf_counter()
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            continue
+        with lock:
+            timings["generate"].append(generated - start)
+            timings["render"].append(done - generated)
+            timings["total"].append(done - start)
+            if generation.cached:
+                timings["cached"].append(generated - start)
+            else:
+                timings["ttft"].append(generation.ttft)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent sessions")
+    parser.add_argument("--requests", type=int, default=10, help="requests per session")
+    parser.add_argument("--formats", nargs="*", default=["png"], help="formats rendered per request")
+    parser.add_argument("--backend", default="fake", help="LLM_BACKEND to load-test")
+    parser.add_argument("--latency", default="lognormal:1.0,0.4", help="fake LLM time to first chunk")
+    parser.add_argument("--chunk-latency", default="fixed:0.01", help="fake LLM delay between chunks")
+    parser.add_argument("--responses", help="JSONL file of recorded responses for the fake LLM")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", action="store_true", help="reuse descriptions, exercising the prompt cache")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ["LLM_BACKEND"] = args.backend
+    os.environ["FAKE_LLM_LATENCY"] = args.latency
+    os.environ["FAKE_LLM_CHUNK_LATENCY"] = args.chunk_latency
+    os.environ["FAKE_LLM_SEED"] = str(args.seed)
+    if args.responses:
+        os.environ["FAKE_LLM_RESPONSES"] = args.responses
+    # Fresh prompt cache and output directory, so runs do not affect each other
+    os.environ["PROMPT_CACHE_PATH"] = os.path.join(workdir, "prompt_cache.sqlite3")
+    if not args.repeat:
+        os.environ["PROMPT_CACHE_SIMILARITY"] = "0"
+    os.environ.setdefault("OUTPUT_DIR", os.path.join(workdir, "outputs"))
+
+    timings = {"generate": [], "render": [], "total": [], "ttft": [], "cached": []}
+    errors = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as executor:
+        for i in range(args.sessions):
+            executor.submit(session, i, args.requests, args.formats, args.repeat, timings, errors, lock)
+    elapsed = time.perf_counter() - start
+
+    completed = len(timings["total"])
+    print(f"{completed} requests in {elapsed:.1f}s: {completed / elapsed:.2f} req/s, "
+          f"{len(timings['cached'])} prompt cache hits, {len(errors)} errors")
+    print(f"{'stage':<10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, values in timings.items():
+        if values:
+            print(f"{stage:<10}{statistics.mean(values) * 1000:>10.1f}{percentile(values, 0.5) * 1000:>10.1f}"
+                  f"{percentile(values, 0.95) * 1000:>10.1f}{percentile(values, 0.99) * 1000:>10.1f}")
+    for error in sorted(set(errors))[:5]:
+        print(f"  {errors.count(error)}x {error}")
+    raise SystemExit(1 if errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Compare per-call dot subprocesses with the persistent worker pool.
+
+Usage: python benchmarks/render_backends.py [--runs 20] [--nodes 8 25 45] [--formats png pdf]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exporter import RENDER_BACKENDS, get_render_pool  # noqa: E402
+
+
+def chain_graph(nodes: int) -> str:
+    lines = ["digraph Flowchart {", "rankdir=LR;", 'node [shape="box", style="filled"];']
+    lines += [f'n{i} [label="Step {i}"];' for i in range(nodes)]
+    lines += [f'n{i} -> n{i + 1} [label="next"];' for i in range(nodes - 1)]
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def measure(backend: str, dot_code: str, fmt: str, runs: int) -> list:
+    pipe = RENDER_BACKENDS[backend]
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        pipe(dot_code, fmt, "dot", 200 if fmt == "png" else None)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[8, 25, 45])
+    parser.add_argument("--formats", nargs="+", default=["png", "pdf"])
+    args = parser.parse_args()
+
+    # Start the pool's workers outside the measured runs
+    warmup = chain_graph(2)
+    for _ in range(get_render_pool().processes):
+        RENDER_BACKENDS["pool"](warmup, "png")
+
+    print(f"{'backend':<12}{'nodes':>6}{'format':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for nodes in args.nodes:
+        dot_code = chain_graph(nodes)
+        for fmt in args.formats:
+            for backend in RENDER_BACKENDS:
+                timings = sorted(measure(backend, dot_code, fmt, args.runs))
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                print(f"{backend:<12}{nodes:>6}{fmt:>8}{statistics.mean(timings):>10.1f}"
+                      f"{statistics.median(timings):>10.1f}{p95:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Benchmark the generate -> clean -> render pipeline against a stored baseline.
+
+Usage:
+    python benchmarks/suite.py                  # run and print
+    python benchmarks/suite.py --update         # run and store the baseline
+    python benchmarks/suite.py --check          # run and fail on regressions
+    python benchmarks/suite.py --filter render  # only cases containing "render"
+
+The corpus has small (<10 nodes), medium (10-30) and large (>30) graphs,
+matching the size tiers of the generation prompt. Timings are medians in
+milliseconds and memory is the tracemalloc peak of one call. Baselines are
+machine-specific: create one with --update on the machine running --check,
+which fails when there is none. CI measures the base branch of a pull request
+with --update and checks the pull request against it.
+Render cases need the Graphviz ``dot`` executable and are skipped without it.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# (name, nodes, clusters); the node counts sit inside the prompt's tiers
+SIZES = [("small", 8, 2), ("medium", 20, 3), ("large", 45, 5)]
+FORMATS = ["png", "pdf", "svg"]
+DPIS = [96, 200]
+SCAN_FILES = 1000
+
+
+def flowchart_graph(nodes: int, clusters: int) -> str:
+    """A deterministic flowchart styled the way the full prompt asks for."""
+    fontsize, node_fontsize, margin = ("12", "11", "0.25,0.15") if nodes < 10 else (
+        ("11", "10", "0.2,0.1") if nodes <= 30 else ("10", "9", "0.15,0.08"))
+    colors = ["#d9f3ff", "#fff0e0", "#e6ffe6", "#f0e6ff", "#ffe6f0"]
+    lines = [
+        "digraph Flowchart {",
+        '    rankdir=LR; ranksep="0.5"; nodesep="0.3"; size="8,10"; ratio="compress";',
+        "    splines=true; concentrate=true;",
+        f'    bgcolor="#f7f7f7"; fontname="Arial"; fontsize={fontsize};',
+        f'    node [shape="box", style="filled", fillcolor="#e0e0e0", penwidth="1.5", fontcolor="#333333", '
+        f'color="#333333", fontname="Arial", fontsize={node_fontsize}, margin="{margin}"];',
+        '    edge [fontname="Arial", fontsize="8", fontcolor="#666666", color="#666666"];',
+    ]
+    per_cluster = -(-nodes // clusters)
+    for c in range(clusters):
+        members = range(c * per_cluster, min(nodes, (c + 1) * per_cluster))
+        lines.append(f"    subgraph cluster_{c} {{")
+        lines.append(f'        label="Stage {c + 1}"; style="filled"; fillcolor="{colors[c % len(colors)]}";')
+        for i in members:
+            shape = ', shape="cylinder"' if i == nodes - 1 else (', shape="diamond"' if i % 7 == 3 else "")
+            lines.append(f'        n{i} [label="Step {i}: process item"{shape}];')
+        lines.append("    }")
+    for i in range(nodes - 1):
+        lines.append(f'    n{i} -> n{i + 1} [label="next"];')
+        if i % 7 == 3 and i + 3 < nodes:
+            lines.append(f'    n{i} -> n{i + 3} [label="skip"];')
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def llm_output(dot_code: str) -> str:
+    return f"```dot\n{dot_code}\n```\n"
+
+
+def measure(fn, repeat: int, min_time: float = 0.02) -> dict:
+    fn()  # warm up and calibrate
+    start = time.perf_counter()
+    fn()
+    number = max(1, int(min_time / max(time.perf_counter() - start, 1e-9)))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number * 1000)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"median_ms": statistics.median(timings), "min_ms": min(timings), "peak_kb": peak / 1024}
+
+
+def cases(workdir: str) -> dict:
+    """Benchmark name -> zero-argument callable."""
+    from dotparse import parse_dot, repair_dot
+    from exporter import RENDER_BACKENDS, cleanup_old_outputs, get_render_cache, render_bytes, save_dot_file
+    from flowchart import DotStreamParser, clean_dot_output
+    from janitor import OutputJanitor
+
+    result = {}
+    for size, nodes, clusters in SIZES:
+        dot_code = flowchart_graph(nodes, clusters)
+        raw = llm_output(dot_code)
+        broken = raw.replace("}\n```", "\n```")  # missing closing brace
+
+        def stream_clean(raw=raw):
+            parser = DotStreamParser()
+            for i in range(0, len(raw), 16):
+                parser.feed(raw[i:i + 16])
+            parser.close()
+
+        result[f"clean/{size}"] = lambda raw=raw: clean_dot_output(raw)
+        result[f"stream_clean/{size}"] = stream_clean
+        result[f"repair_valid/{size}"] = lambda dot_code=dot_code: repair_dot(dot_code)
+        result[f"repair_broken/{size}"] = lambda broken=broken: repair_dot(clean_dot_output(broken))
+        result[f"parse_serialize/{size}"] = lambda dot_code=dot_code: parse_dot(dot_code).to_dot()
+
+        counter = iter(range(10 ** 9))
+        result[f"save_dot_file/{size}"] = lambda dot_code=dot_code, counter=counter: save_dot_file(
+            f"{dot_code}\n// {next(counter)}")
+
+        if shutil.which("dot"):
+            for fmt in FORMATS:
+                for dpi in DPIS if fmt == "png" else [None]:
+                    def render(dot_code=dot_code, fmt=fmt, dpi=dpi):
+                        # Cold render: no cached output or layout
+                        get_render_cache().clear()
+                        render_bytes(dot_code, fmt, dpi or 200)
+                    result[f"render/{size}/{fmt}" + (f"@{dpi}" if dpi else "")] = render
+            result[f"graphviz_pipe/{size}/png"] = (
+                lambda dot_code=dot_code: RENDER_BACKENDS["subprocess"](dot_code, "png", "dot", 200))
+
+    scan_dir = os.path.join(workdir, "scan")
+    os.makedirs(scan_dir)
+    for i in range(SCAN_FILES):
+        with open(os.path.join(scan_dir, f"{i}.png"), "wb") as f:
+            f.write(b"x" * 1024)
+    janitor = OutputJanitor(scan_dir)
+    janitor.scan()
+
+    def cleanup_scan():
+        # Nothing is old enough to delete: this is the cost of the directory scan
+        os.environ["OUTPUT_DIR"] = scan_dir
+        try:
+            cleanup_old_outputs()
+        finally:
+            os.environ["OUTPUT_DIR"] = os.path.join(workdir, "outputs")
+
+    result[f"cleanup_old_outputs/{SCAN_FILES}_files"] = cleanup_scan
+    result[f"janitor_run_once/{SCAN_FILES}_files"] = janitor.run_once
+    return result
+
+
+def compare(results: dict, baseline: dict, threshold: float, noise_ms: float) -> list:
+    """Cases slower (or using more memory) than the baseline by more than ``threshold``."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if (current["median_ms"] > base["median_ms"] * (1 + threshold)
+                and current["median_ms"] - base["median_ms"] > noise_ms):
+            regressions.append(f"{name}: {base['median_ms']:.3f} -> {current['median_ms']:.3f} ms")
+        if current["peak_kb"] > base["peak_kb"] * (1 + threshold) and current["peak_kb"] - base["peak_kb"] > 64:
+            regressions.append(f"{name}: peak {base['peak_kb']:.0f} -> {current['peak_kb']:.0f} KB")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="fail if a case regressed beyond --threshold")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown")
+    parser.add_argument("--noise-ms", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+    if args.check and not os.path.exists(args.baseline):
+        parser.error(f"no baseline at {args.baseline}; create one with --update on this machine")
+
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    # Keep the benchmark away from real outputs and caches
+    os.environ["OUTPUT_DIR"] = os.path.join(workdir, "outputs")
+    os.environ["RENDER_BACKEND"] = "subprocess"
+    try:
+        selected = {name: fn for name, fn in cases(workdir).items() if args.filter in name}
+        if not shutil.which("dot"):
+            print("Graphviz 'dot' not found: render cases skipped")
+        results = {}
+        print(f"{'case':<36}{'median ms':>12}{'min ms':>10}{'peak KB':>10}")
+        for name, fn in selected.items():
+            results[name] = measure(fn, args.repeat)
+            r = results[name]
+            print(f"{name:<36}{r['median_ms']:>12.3f}{r['min_ms']:>10.3f}{r['peak_kb']:>10.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"python": sys.version.split()[0], "platform": sys.platform, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.update:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f).get("results", {})
+        # A filtered run only replaces the cases it measured
+        report["results"] = {**baseline, **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+    if args.check:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.noise_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
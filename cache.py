@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def normalize_dot(dot_code: str) -> str:
+    """Canonical form of DOT source used for cache keys (line endings and trailing whitespace)."""
+    return "\n".join(line.rstrip() for line in dot_code.strip().splitlines())
+
+
+def render_key(dot_code: str, fmt: str, dpi: Optional[int] = None) -> str:
+    """Content hash identifying one rendering of a chart."""
+    payload = f"{fmt}\0{dpi or ''}\0{normalize_dot(dot_code)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """Size-bounded in-memory LRU of rendered bytes with a disk fallback.
+
+    Entries written with ``persist`` are stored in an ArtifactStore under
+    the name ``render:<key>.<fmt>``; lookups that miss memory fall back to
+    the store, so a persisted chart survives eviction and process restarts,
+    and identical bytes are kept on disk only once.
+    """
+
+    def __init__(self, store=None, max_bytes: int = 64 * 1024 * 1024):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, fmt: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get((key, fmt))
+            if data is not None:
+                self._entries.move_to_end((key, fmt))
+                self.hits += 1
+                return data
+        artifact = self.store.resolve(f"render:{key}.{fmt}") if self.store else None
+        if artifact is not None:
+            try:
+                data = self.store.read(artifact.digest)
+            except (OSError, KeyError):
+                data = None
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember((key, fmt), data)
+                return data
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, fmt: str, data: bytes) -> None:
+        with self._lock:
+            self._remember((key, fmt), data)
+
+    def persist(self, key: str, fmt: str, data: bytes, compress: bool = True):
+        """Make sure the entry exists on disk and return its Artifact (None without a store)."""
+        if self.store is None:
+            return None
+        return self.store.put(data, fmt, name=f"render:{key}.{fmt}", compress=compress)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remember(self, item: tuple, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        previous = self._entries.pop(item, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[item] = data
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+
+def normalize_prompt(text: str) -> str:
+    """Case- and whitespace-insensitive form of a user description."""
+    return " ".join(text.lower().split())
+
+
+_MINHASH_PRIME = (1 << 61) - 1
+_MINHASH_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MINHASH_PRIME or 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MINHASH_PRIME,
+    )
+    for i in range(128)
+]
+# 16 bands of 8 rows: candidates need one fully matching band, then the
+# estimate over all 128 permutations decides
+_MINHASH_BANDS = 16
+
+
+def minhash_signature(text: str, shingle_size: int = 3) -> tuple:
+    """MinHash signature over word shingles of the normalized text."""
+    words = normalize_prompt(text).split()
+    if len(words) < shingle_size:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1)}
+    hashed = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+        for s in shingles
+    ]
+    return tuple(
+        min((a * h + b) % _MINHASH_PRIME for h in hashed)
+        for a, b in _MINHASH_PERMUTATIONS
+    )
+
+
+def _signature_bands(signature: tuple) -> list:
+    rows = len(signature) // _MINHASH_BANDS
+    return [
+        hashlib.blake2b(repr((i, signature[i * rows:(i + 1) * rows])).encode(), digest_size=8).hexdigest()
+        for i in range(_MINHASH_BANDS)
+    ]
+
+
+class PromptCache:
+    """Persistent SQLite cache of LLM responses keyed by user description.
+
+    Lookups try an exact match on the normalized description first and, when
+    ``similarity`` is set, fall back to the closest near-duplicate found via
+    MinHash/LSH whose estimated Jaccard similarity reaches the threshold.
+    Entries are scoped to ``namespace`` (model and prompt version), expire
+    after ``ttl`` seconds and are evicted least-recently-used beyond
+    ``max_entries``.
+    """
+
+    def __init__(self, path: str, namespace: str = "", ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 10000, similarity: float = 0.0):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def key(self, text: str) -> str:
+        payload = f"{self.namespace}\0{normalize_prompt(text)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> Optional[str]:
+        key = self.key(text)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+                return row[0]
+            match = self._nearest(conn, text) if self.similarity else None
+            if match is not None:
+                self.near_hits += 1
+                conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, match[0]))
+                conn.commit()
+                return match[1]
+            self.misses += 1
+            conn.commit()
+            return None
+
+    def put(self, text: str, response: str) -> None:
+        key = self.key(text)
+        now = time.time()
+        # Signatures are only needed for near-duplicate lookups
+        signature = minhash_signature(text) if self.similarity else ()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, namespace, response, signature, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, self.namespace, response, json.dumps(signature), now, now),
+            )
+            conn.execute("DELETE FROM bands WHERE key = ?", (key,))
+            conn.executemany(
+                "INSERT INTO bands (band, key) VALUES (?, ?)",
+                [(f"{self.namespace}:{band}", key) for band in _signature_bands(signature)] if signature else [],
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (overflow,),
+                )
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "near_hits": self.near_hits, "misses": self.misses, "entries": entries}
+
+    def _nearest(self, conn, text: str) -> Optional[tuple]:
+        signature = minhash_signature(text)
+        bands = [f"{self.namespace}:{band}" for band in _signature_bands(signature)]
+        rows = conn.execute(
+            "SELECT DISTINCT r.key, r.response, r.signature FROM bands b JOIN responses r ON r.key = b.key "
+            f"WHERE b.band IN ({','.join('?' * len(bands))})",
+            bands,
+        ).fetchall()
+        best = None
+        best_score = self.similarity
+        for key, response, stored in rows:
+            stored = json.loads(stored)
+            if len(stored) != len(signature):
+                continue  # written with another signature size
+            score = sum(a == b for a, b in zip(signature, stored)) / len(signature)
+            if score >= best_score:
+                best, best_score = (key, response), score
+        return best
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    signature TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+                CREATE INDEX IF NOT EXISTS responses_created ON responses (created_at);
+                CREATE TABLE IF NOT EXISTS bands (band TEXT NOT NULL, key TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS bands_band ON bands (band);
+                CREATE INDEX IF NOT EXISTS bands_key ON bands (key);
+                CREATE TRIGGER IF NOT EXISTS responses_drop_bands AFTER DELETE ON responses
+                BEGIN
+                    DELETE FROM bands WHERE key = OLD.key;
+                END;
+            """)
+            self._conn = conn
+        return self._conn
@@ -0,0 +1,111 @@
+"""Client for the HTTP API in api.py, used by app.py when API_URL is set.
+
+Mirrors the local ``stream_dot_code``, ``render_formats``, ``render_preview``
+and ``prefetch`` so the
+Streamlit script can switch between in-process and remote work.
+"""
+import json
+import threading
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterator, Optional
+
+from config import getenv
+from flowchart import Generation
+
+# Most recent renders by (fmt, dpi, dot_code) -> (etag, bytes), revalidated with If-None-Match
+_renders = OrderedDict()
+_renders_lock = threading.Lock()
+MAX_CACHED_RENDERS = 32
+
+
+class APIError(RuntimeError):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"API error {status}: {message}")
+        self.status = status
+
+
+def _post(path: str, payload: dict, headers: Optional[dict] = None):
+    url = getenv("API_URL", "http://localhost:8000").rstrip("/") + path
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json", **(headers or {})},
+        method="POST",
+    )
+    try:
+        return urllib.request.urlopen(request, timeout=float(getenv("API_TIMEOUT", 120)))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return e
+        try:
+            message = json.loads(e.read()).get("error", e.reason)
+        except ValueError:
+            message = e.reason
+        raise APIError(e.code, message) from None
+
+
+def stream_dot_code(user_input: str, generation: Optional[Generation] = None) -> Iterator[str]:
+    """Remote stream_dot_code: fragments as they arrive, details in ``generation``."""
+    generation = generation if generation is not None else Generation()
+    with _post("/generate", {"description": user_input, "stream": True}) as response:
+        for line in response:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "fragment" in item:
+                yield item["fragment"]
+            elif "generation" in item:
+                for name, value in item["generation"].items():
+                    setattr(generation, name, value)
+            elif "error" in item:
+                raise APIError(500, item["error"])
+
+
+def render_bytes(dot_code: str, fmt: str = "png", dpi: Optional[int] = None) -> bytes:
+    """Remote render_bytes; without ``dpi`` the server's EXPORT_DPI applies."""
+    key = (fmt, dpi if fmt == "png" else None, dot_code)
+    with _renders_lock:
+        cached = _renders.get(key)
+    headers = {"If-None-Match": cached[0]} if cached else None
+    payload = {"dot_code": dot_code, "format": fmt}
+    if dpi:
+        payload["dpi"] = dpi
+    with _post("/render", payload, headers) as response:
+        if response.status == 304 and cached:
+            data = cached[1]
+        else:
+            data = response.read()
+        etag = response.headers.get("ETag")
+    with _renders_lock:
+        if etag:
+            _renders[key] = (etag, data)
+            _renders.move_to_end(key)
+            while len(_renders) > MAX_CACHED_RENDERS:
+                _renders.popitem(last=False)
+    return data
+
+
+def render_formats(dot_code: str, formats=("png", "pdf", "svg"), dpi: Optional[int] = None) -> dict:
+    """Remote render_formats; the server shares one layout between the formats."""
+    return {fmt: render_bytes(dot_code, fmt, dpi) for fmt in formats}
+
+
+def render_preview(dot_code: str) -> tuple:
+    """Remote render_preview, returning (format, bytes)."""
+    fmt = getenv("PREVIEW_FORMAT", "svg")
+    return fmt, render_bytes(dot_code, fmt, int(getenv("PREVIEW_DPI", 72)))
+
+
+@lru_cache(maxsize=None)
+def _prefetch_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=int(getenv("PREFETCH_WORKERS", 2)), thread_name_prefix="api-prefetch")
+
+
+def prefetch(dot_code: str, formats=("png", "pdf", "svg"), dpi: Optional[int] = None) -> Future:
+    """Remote prefetch: renders land in the local cache, so the later
+    render_formats call only revalidates them."""
+    return _prefetch_executor().submit(render_formats, dot_code, formats, dpi)
@@ -0,0 +1,15 @@
+import os
+from functools import lru_cache
+from typing import Optional
+
+
+@lru_cache(maxsize=None)
+def load_env() -> None:
+    """Load variables from a .env file once, on first use rather than at import."""
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def getenv(name: str, default: Optional[str] = None) -> Optional[str]:
+    load_env()
+    return os.getenv(name, default)
@@ -0,0 +1,242 @@
+import copy
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+# Attributes that only affect how a laid-out graph is drawn, never where
+# things are placed, so changing them can reuse a cached layout.
+PAINT_ATTRS = {
+    "bgcolor", "class", "color", "colorscheme", "comment", "dpi", "fillcolor",
+    "fontcolor", "gradientangle", "href", "id", "labelfontcolor", "pencolor",
+    "penwidth", "style", "stylesheet", "target", "tooltip", "truecolor", "url",
+}
+
+# Attributes written by a Graphviz layout (``-Tdot`` output)
+LAYOUT_ATTRS = {
+    "bb", "head_lp", "height", "lheight", "lp", "lwidth", "pos", "rects",
+    "tail_lp", "width", "xlp",
+}
+
+_KEYWORDS = {"strict", "graph", "digraph", "subgraph", "node", "edge"}
+# Letters, "_" and any non-ASCII character, then digits too. Written as negated
+# ASCII ranges: the equivalent \u0080-\uffff range takes milliseconds to compile
+_BARE_ID_RE = re.compile(r"[^\x00-\x40\x5b-\x5e\x60\x7b-\x7f][^\x00-\x2f\x3a-\x40\x5b-\x5e\x60\x7b-\x7f]*"
+                         r"|-?(?:\.\d+|\d+(?:\.\d*)?)")
+
+
+class Html(str):
+    """An HTML-like label value, stored without its outer angle brackets."""
+
+
+def quote_id(value: str) -> str:
+    if isinstance(value, Html):
+        return f"<{value}>"
+    if _BARE_ID_RE.fullmatch(value) and value.lower() not in _KEYWORDS:
+        return value
+    return '"' + value.replace('"', '\\"') + '"'
+
+
+def format_attrs(attrs: dict) -> str:
+    return ", ".join(f"{quote_id(k)}={quote_id(v)}" for k, v in attrs.items())
+
+
+@dataclass
+class Edge:
+    tail: str
+    head: str
+    attrs: dict = field(default_factory=dict)
+    tailport: Optional[str] = None
+    headport: Optional[str] = None
+
+
+@dataclass
+class Subgraph:
+    """A scope of the graph: the root, a cluster or an anonymous subgraph.
+
+    ``items`` keeps statement order as ("node", id), ("edge", Edge),
+    ("subgraph", Subgraph), ("node_defaults", attrs) and ("edge_defaults",
+    attrs) entries, since defaults only apply to later statements.
+    """
+    name: Optional[str] = None
+    attrs: dict = field(default_factory=dict)
+    items: list = field(default_factory=list)
+
+    def subgraphs(self) -> Iterator["Subgraph"]:
+        for kind, item in self.items:
+            if kind == "subgraph":
+                yield item
+                yield from item.subgraphs()
+
+    def edges(self) -> Iterator[Edge]:
+        for kind, item in self.items:
+            if kind == "edge":
+                yield item
+            elif kind == "subgraph":
+                yield from item.edges()
+
+    def node_ids(self) -> list:
+        """Nodes declared or used by an edge in this scope, in first-seen order."""
+        seen = {}
+        for kind, item in self.items:
+            if kind == "node":
+                seen[item] = None
+            elif kind == "edge":
+                seen[item.tail] = seen[item.head] = None
+            elif kind == "subgraph":
+                seen.update(dict.fromkeys(item.node_ids()))
+        return list(seen)
+
+    def defaults(self) -> list:
+        return [(kind, item) for kind, item in self.items if kind in ("node_defaults", "edge_defaults")]
+
+    @property
+    def is_cluster(self) -> bool:
+        return bool(self.name) and self.name.lower().startswith("cluster")
+
+
+@dataclass
+class Graph(Subgraph):
+    """Parsed DOT graph. Node attributes are global, as in Graphviz."""
+    directed: bool = True
+    strict: bool = False
+    nodes: dict = field(default_factory=dict)
+
+    def to_dot(self) -> str:
+        header = f"{'strict ' if self.strict else ''}{'digraph' if self.directed else 'graph'}"
+        if self.name:
+            header += f" {quote_id(self.name)}"
+        lines = [header + " {"]
+        declared = set()
+        self._write_scope(self, lines, "    ", declared)
+        # Nodes only created by edges get their attributes (e.g. positions) last
+        for node, attrs in self.nodes.items():
+            if node not in declared and attrs:
+                lines.append(f"    {quote_id(node)} [{format_attrs(attrs)}];")
+        lines.append("}")
+        return "\n".join(lines)
+
+    def _write_scope(self, scope: Subgraph, lines: list, indent: str, declared: set) -> None:
+        for key, value in scope.attrs.items():
+            lines.append(f"{indent}{quote_id(key)}={quote_id(value)};")
+        op = "->" if self.directed else "--"
+        for kind, item in scope.items:
+            if kind == "node":
+                attrs = self.nodes.get(item) if item not in declared else None
+                declared.add(item)
+                suffix = f" [{format_attrs(attrs)}]" if attrs else ""
+                lines.append(f"{indent}{quote_id(item)}{suffix};")
+            elif kind == "edge":
+                tail = quote_id(item.tail) + (f":{item.tailport}" if item.tailport else "")
+                head = quote_id(item.head) + (f":{item.headport}" if item.headport else "")
+                suffix = f" [{format_attrs(item.attrs)}]" if item.attrs else ""
+                lines.append(f"{indent}{tail} {op} {head}{suffix};")
+            elif kind == "subgraph":
+                name = f"subgraph {quote_id(item.name)} " if item.name else ""
+                lines.append(f"{indent}{name}{{")
+                self._write_scope(item, lines, indent + "    ", declared)
+                lines.append(f"{indent}}}")
+            elif item:
+                lines.append(f"{indent}{kind.split('_')[0]} [{format_attrs(item)}];")
+
+    def node_count(self) -> int:
+        return len(self.nodes)
+
+    def clusters(self) -> list:
+        return [s for s in self.subgraphs() if s.is_cluster]
+
+    def edge_keys(self) -> dict:
+        """Edges keyed by (tail, head, n) where n counts repeated tail/head pairs."""
+        keyed = {}
+        seen = {}
+        for edge in self.edges():
+            pair = (edge.tail, edge.head)
+            seen[pair] = seen.get(pair, -1) + 1
+            keyed[pair + (seen[pair],)] = edge
+        return keyed
+
+    def without(self, names: set) -> "Graph":
+        """Copy of the graph with the given attributes removed everywhere."""
+        graph = copy.deepcopy(self)
+        scopes = [graph, *graph.subgraphs()]
+        for attrs in [
+            *(s.attrs for s in scopes), *(d for s in scopes for _, d in s.defaults()),
+            *graph.nodes.values(), *(e.attrs for e in graph.edges()),
+        ]:
+            for key in [k for k in attrs if k.lower() in names]:
+                del attrs[key]
+        return graph
+
+    def layout_signature(self) -> str:
+        """Hash of everything that can influence the layout (paint attributes excluded)."""
+        source = self.without(PAINT_ATTRS).to_dot()
+        return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+    def with_layout(self, positioned: "Graph") -> "Graph":
+        """Copy of this graph carrying node, edge and cluster positions from a laid-out graph."""
+        graph = copy.deepcopy(self)
+        for node_id, attrs in graph.nodes.items():
+            layout = positioned.nodes.get(node_id, {})
+            attrs.update({k: v for k, v in layout.items() if k in LAYOUT_ATTRS})
+        placed = positioned.edge_keys()
+        for key, edge in graph.edge_keys().items():
+            layout = placed[key].attrs if key in placed else {}
+            edge.attrs.update({k: v for k, v in layout.items() if k in LAYOUT_ATTRS})
+        placed_scopes = {s.name: s for s in positioned.subgraphs() if s.name}
+        for scope in graph.subgraphs():
+            layout = placed_scopes.get(scope.name)
+            if layout is not None:
+                scope.attrs.update({k: v for k, v in layout.attrs.items() if k in LAYOUT_ATTRS})
+        graph.attrs.update({k: v for k, v in positioned.attrs.items() if k in LAYOUT_ATTRS})
+        return graph
+
+
+@dataclass
+class GraphDiff:
+    added_nodes: list = field(default_factory=list)
+    removed_nodes: list = field(default_factory=list)
+    changed_nodes: list = field(default_factory=list)
+    added_edges: list = field(default_factory=list)
+    removed_edges: list = field(default_factory=list)
+    changed_edges: list = field(default_factory=list)
+    graph_changed: bool = False
+    layout_changed: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(
+            self.added_nodes or self.removed_nodes or self.changed_nodes or self.added_edges
+            or self.removed_edges or self.changed_edges or self.graph_changed
+        )
+
+    def summary(self) -> str:
+        parts = []
+        for label, items in (
+            ("node(s) added", self.added_nodes), ("node(s) removed", self.removed_nodes),
+            ("node(s) changed", self.changed_nodes), ("edge(s) added", self.added_edges),
+            ("edge(s) removed", self.removed_edges), ("edge(s) changed", self.changed_edges),
+        ):
+            if items:
+                parts.append(f"{len(items)} {label}")
+        if self.graph_changed:
+            parts.append("graph or cluster attributes changed")
+        return ", ".join(parts) or "no changes"
+
+
+def diff_graphs(old: Graph, new: Graph) -> GraphDiff:
+    """Structural difference between two revisions of a graph."""
+    result = GraphDiff()
+    result.added_nodes = [n for n in new.nodes if n not in old.nodes]
+    result.removed_nodes = [n for n in old.nodes if n not in new.nodes]
+    result.changed_nodes = [n for n in new.nodes if n in old.nodes and new.nodes[n] != old.nodes[n]]
+    old_edges, new_edges = old.edge_keys(), new.edge_keys()
+    result.added_edges = [k for k in new_edges if k not in old_edges]
+    result.removed_edges = [k for k in old_edges if k not in new_edges]
+    result.changed_edges = [k for k in new_edges if k in old_edges and new_edges[k] != old_edges[k]]
+    old_scopes = [(s.name, s.attrs, s.defaults(), s.node_ids()) for s in old.subgraphs()]
+    new_scopes = [(s.name, s.attrs, s.defaults(), s.node_ids()) for s in new.subgraphs()]
+    result.graph_changed = (
+        old_scopes != new_scopes or (old.attrs, old.defaults()) != (new.attrs, new.defaults())
+        or (old.directed, old.strict, old.name) != (new.directed, new.strict, new.name)
+    )
+    result.layout_changed = old.layout_signature() != new.layout_signature()
+    return result
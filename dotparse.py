@@ -0,0 +1,460 @@
+import re
+from typing import Iterator, NamedTuple, Optional
+
+from dotgraph import Edge, Graph, Html, Subgraph
+
+
+class DotSyntaxError(ValueError):
+    """Raised when DOT code does not follow the Graphviz grammar."""
+
+    def __init__(self, message: str, text: str = "", pos: Optional[int] = None):
+        if pos is not None:
+            line = text.count("\n", 0, pos) + 1
+            column = pos - (text.rfind("\n", 0, pos) + 1) + 1
+            message = f"{message} (line {line}, column {column})"
+        super().__init__(message)
+        self.pos = pos
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+    start: int
+    end: int
+
+
+KEYWORDS = {"strict", "graph", "digraph", "subgraph", "node", "edge"}
+# Builds a Token from a tuple without NamedTuple's keyword-handling __new__
+_new_token = tuple.__new__
+
+# IDs as in dotgraph._BARE_ID_RE, spelled as negated ASCII ranges to compile fast
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"[^"\\]*(?:\\.[^"\\]*)*")
+  | (?P<unterminated>")
+  | (?P<html><)
+  | (?P<edgeop>->|--)
+  | (?P<number>-?(?:\.\d+|\d+(?:\.\d*)?))
+  | (?P<id>[^\x00-\x40\x5b-\x5e\x60\x7b-\x7f][^\x00-\x2f\x3a-\x40\x5b-\x5e\x60\x7b-\x7f]*)
+  | (?P<punct>[{}\[\];,=:])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+def _html_end(text: str, start: int) -> int:
+    depth = 0
+    for i in range(start, len(text)):
+        if text[i] == "<":
+            depth += 1
+        elif text[i] == ">":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return -1
+
+
+def iter_tokens(text: str) -> Iterator[Token]:
+    """Lazily split DOT source into tokens, dropping whitespace and comments.
+
+    Characters that cannot start a DOT token become ``other`` tokens and an
+    unclosed quote becomes an ``unterminated`` token, so callers can report
+    or repair them.
+    """
+    pos = len(text)
+    # Fast path: one regex scan, until a token needs looking around ('#' at
+    # the start of a line, or an HTML string whose end depends on nesting)
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == "ws" or kind == "comment":
+            continue
+        value = match.group()
+        if kind == "html" or value == "#":
+            pos = match.start()
+            break
+        if kind == "id" and value.lower() in KEYWORDS:
+            kind = "keyword"
+        yield _new_token(Token, (kind, value, match.start(), match.end()))
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        kind = match.lastgroup
+        end = match.end()
+        if kind == "other" and match.group() == "#" and not text[text.rfind("\n", 0, pos) + 1:pos].strip():
+            # Lines starting with '#' are C preprocessor output and ignored
+            kind = "comment"
+            end = text.find("\n", pos)
+            end = len(text) if end == -1 else end
+        elif kind == "html":
+            end = _html_end(text, pos)
+            if end == -1:
+                kind, end = "other", pos + 1
+        if kind == "id" and match.group().lower() in KEYWORDS:
+            kind = "keyword"
+        if kind not in ("ws", "comment"):
+            yield _new_token(Token, (kind, text[pos:end], pos, end))
+        pos = end
+
+
+def tokenize(text: str) -> list:
+    return list(iter_tokens(text))
+
+
+def is_id(token: Token) -> bool:
+    return token.kind in ("id", "number", "string", "html")
+
+
+class _Parser:
+    """Recursive-descent parser for the DOT grammar."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.i = 0
+        self.directed = True
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        # The hottest method of the parser: indexing beats a length check
+        try:
+            return self.tokens[self.i + offset]
+        except IndexError:
+            return None
+
+    def error(self, message: str, token: Optional[Token] = None):
+        token = token or self.peek()
+        pos = token.start if token else len(self.text)
+        found = f", found {token.value!r}" if token else ", found end of input"
+        raise DotSyntaxError(message + found, self.text, pos)
+
+    def accept(self, value: str) -> Optional[Token]:
+        token = self.peek()
+        if token and token.kind in ("punct", "edgeop", "keyword") and (token.value == value
+                                                                 or token.value.lower() == value):
+            self.i += 1
+            return token
+        return None
+
+    def expect(self, value: str) -> Token:
+        token = self.accept(value)
+        if token is None:
+            self.error(f"Expected {value!r}")
+        return token
+
+    def expect_id(self, what: str = "identifier") -> Token:
+        token = self.peek()
+        if token is None or not is_id(token):
+            self.error(f"Expected {what}")
+        self.i += 1
+        return token
+
+    def parse(self) -> Graph:
+        for token in self.tokens:
+            if token.kind == "unterminated":
+                self.error("Unterminated string", token)
+            if token.kind == "other":
+                self.error("Unexpected character", token)
+        strict = bool(self.accept("strict"))
+        if self.accept("digraph"):
+            self.directed = True
+        elif self.accept("graph"):
+            self.directed = False
+        else:
+            self.error("Expected 'graph' or 'digraph'")
+        self.graph = Graph(directed=self.directed, strict=strict)
+        if self.peek() and is_id(self.peek()):
+            self.graph.name = id_value(self.expect_id())
+        self.expect("{")
+        self.stmt_list(self.graph)
+        self.expect("}")
+        if self.peek() is not None:
+            self.error("Unexpected content after the graph")
+        return self.graph
+
+    def stmt_list(self, scope: Subgraph) -> None:
+        while True:
+            token = self.peek()
+            if token is None or (token.kind == "punct" and token.value == "}"):
+                return
+            self.stmt(scope)
+            self.accept(";")
+
+    def stmt(self, scope: Subgraph) -> None:
+        token = self.peek()
+        keyword = token.value.lower() if token.kind == "keyword" else None
+        if keyword in ("graph", "node", "edge"):
+            self.i += 1
+            attrs = self.attr_list(required=True)
+            if keyword == "graph":
+                scope.attrs.update(attrs)
+            else:
+                scope.items.append((f"{keyword}_defaults", attrs))
+        elif is_id(token) and self.peek(1) and self.peek(1).value == "=":
+            self.i += 2
+            scope.attrs[id_value(token)] = id_value(self.expect_id("attribute value"))
+        elif keyword == "subgraph" or (token.kind == "punct" and token.value == "{"):
+            self.edge_rhs(scope, self.subgraph(scope))
+        elif is_id(token):
+            endpoint = self.node_id()
+            if not (self.peek() and self.peek().kind == "edgeop"):
+                node = endpoint[0]
+                self.graph.nodes.setdefault(node, {}).update(self.attr_list())
+                scope.items.append(("node", node))
+            else:
+                self.edge_rhs(scope, endpoint)
+        else:
+            self.error("Expected a statement")
+
+    def attr_list(self, required: bool = False) -> dict:
+        if required and not (self.peek() and self.peek().value == "["):
+            self.error("Expected '['")
+        attrs = {}
+        while self.accept("["):
+            while not self.accept("]"):
+                name = id_value(self.expect_id("attribute name"))
+                self.expect("=")
+                attrs[name] = id_value(self.expect_id("attribute value"))
+                self.accept(",") or self.accept(";")
+        return attrs
+
+    def edge_rhs(self, scope: Subgraph, first) -> None:
+        endpoints = [first]
+        while self.peek() and self.peek().kind == "edgeop":
+            token = self.peek()
+            if (token.value == "->") != self.directed:
+                self.error(f"Edge operator {token.value!r} does not match the graph type", token)
+            self.i += 1
+            if self.peek() and (self.peek().value.lower() == "subgraph" or self.peek().value == "{"):
+                endpoints.append(self.subgraph(scope))
+            else:
+                endpoints.append(self.node_id())
+        attrs = self.attr_list()
+        # "a -> b -> c" and "{a b} -> c" expand to one edge per node pair
+        ends = [[(n, None) for n in e.node_ids()] if isinstance(e, Subgraph) else [e] for e in endpoints]
+        for tails, heads in zip(ends, ends[1:]):
+            for tail, tailport in tails:
+                for head, headport in heads:
+                    self.graph.nodes.setdefault(tail, {})
+                    self.graph.nodes.setdefault(head, {})
+                    scope.items.append(("edge", Edge(tail, head, dict(attrs), tailport, headport)))
+
+    def node_id(self) -> tuple:
+        node = id_value(self.expect_id("node identifier"))
+        port = []
+        if self.accept(":"):
+            port.append(self.expect_id("port").value)
+            if self.accept(":"):
+                port.append(self.expect_id("compass point").value)
+        return node, ":".join(port) or None
+
+    def subgraph(self, scope: Subgraph) -> Subgraph:
+        subgraph = Subgraph()
+        if self.accept("subgraph") and self.peek() and is_id(self.peek()):
+            subgraph.name = id_value(self.expect_id())
+        self.expect("{")
+        self.stmt_list(subgraph)
+        self.expect("}")
+        scope.items.append(("subgraph", subgraph))
+        return subgraph
+
+
+def id_value(token: Token) -> str:
+    """The value of an ID token, with quotes removed and escaped quotes restored."""
+    if token.kind == "string":
+        return token.value[1:-1].replace('\\"', '"').replace("\\\n", "")
+    if token.kind == "html":
+        return Html(token.value[1:-1])
+    return token.value
+
+
+def parse_dot(text: str) -> Graph:
+    """Parse DOT code into a Graph model, raising DotSyntaxError on invalid input."""
+    return _Parser(text).parse()
+
+
+def validate(text: str) -> None:
+    """Raise DotSyntaxError if ``text`` is not a single valid DOT graph."""
+    _Parser(text).parse()
+
+
+class RepairResult(NamedTuple):
+    dot: str
+    fixes: list
+    error: Optional[str]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+_FENCE_RE = re.compile(r"^\s*```[\w+-]*\s*$")
+_LANGUAGE_TAG_RE = re.compile(r"^\s*(?:dot|graphviz|gv)\s*$", re.IGNORECASE)
+
+
+def _quote(value: str) -> str:
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def header_end(tokens: list, i: int) -> Optional[int]:
+    """Index of the '{' ending a graph header that starts at tokens[i], if any."""
+    if tokens[i].kind == "keyword" and tokens[i].value.lower() == "strict":
+        i += 1
+    if i >= len(tokens) or tokens[i].value.lower() not in ("graph", "digraph") or tokens[i].kind != "keyword":
+        return None
+    i += 1
+    if i < len(tokens) and is_id(tokens[i]):
+        i += 1
+    if i < len(tokens) and tokens[i].value == "{":
+        return i
+    return None
+
+
+def _value_end(text: str, tokens: list, i: int) -> int:
+    """Index just past the tokens making up an attribute value starting at tokens[i]."""
+    j = i
+    while j < len(tokens):
+        token = tokens[j]
+        if token.value in ("]", "}", "[", "{", ";") and token.kind == "punct":
+            break
+        if j > i and "\n" in text[tokens[j - 1].end:token.start]:
+            break
+        if token.value == ",":
+            following = tokens[j + 1] if j + 1 < len(tokens) else None
+            after = tokens[j + 2] if j + 2 < len(tokens) else None
+            # A comma followed by "name =" starts the next attribute
+            if following is not None and is_id(following) and after is not None and after.value == "=":
+                break
+        elif j > i and is_id(token) and j + 1 < len(tokens) and tokens[j + 1].value == "=":
+            break
+        j += 1
+    return j
+
+
+def _repair_tokens(text: str, fixes: list) -> str:
+    tokens = tokenize(text)
+    edits = []
+
+    # Unterminated strings are closed at the end of their line, before any "];"
+    for token in tokens:
+        if token.kind == "unterminated":
+            line_end = text.find("\n", token.start)
+            line_end = len(text) if line_end == -1 else line_end
+            close = token.start + re.search(r"\s*\]?\s*[;,]?\s*$", text[token.start:line_end]).start()
+            fixes.append("closed an unterminated string")
+            return text[:close] + '"' + text[close:]
+
+    start = next((i for i in range(len(tokens)) if header_end(tokens, i) is not None), None)
+    if start is None:
+        if any(t.kind == "edgeop" for t in tokens):
+            fixes.append("added a missing graph header")
+            directed = any(t.value == "->" for t in tokens)
+            return f"{'digraph' if directed else 'graph'} G {{\n{text}\n}}"
+        return text
+    if tokens[start].start > 0 and text[:tokens[start].start].strip():
+        edits.append((0, tokens[start].start, ""))
+        fixes.append("removed text before the graph header")
+
+    header = tokens[start + 1] if tokens[start].value.lower() == "strict" else tokens[start]
+    directed = header.value.lower() == "digraph"
+    if not directed and any(t.kind == "edgeop" and t.value == "->" for t in tokens[start:]):
+        edits.append((header.start, header.end, "digraph"))
+        fixes.append("changed 'graph' to 'digraph' for directed edges")
+        directed = True
+
+    i = header_end(tokens, start) + 1
+    stack = [False]  # whether each open brace belongs to a duplicate header
+    root_closed_at = None
+    in_list = False
+    while i < len(tokens):
+        token = tokens[i]
+        at_stmt_start = tokens[i - 1].value in ("{", "}", ";") or "\n" in text[tokens[i - 1].end:token.start]
+        if in_list and token.kind == "punct" and token.value == "]":
+            in_list = False
+        elif in_list and (token.value in ("{", "}", ";") and token.kind == "punct" or (
+                at_stmt_start and tokens[i - 1].value not in (",", "[", "=")
+                and not (i + 1 < len(tokens) and tokens[i + 1].value == "="))):
+            edits.append((tokens[i - 1].end, tokens[i - 1].end, "]"))
+            fixes.append("closed an attribute list")
+            in_list = False
+        elif token.kind == "punct" and token.value == "[":
+            in_list = True
+        if token.kind == "keyword" and at_stmt_start and header_end(tokens, i) is not None:
+            brace = header_end(tokens, i)
+            edits.append((token.start, tokens[brace].end, ""))
+            fixes.append("removed a duplicate graph header")
+            stack.append(True)
+            i = brace + 1
+            continue
+        if token.kind == "punct" and token.value == "{":
+            stack.append(False)
+        elif token.kind == "punct" and token.value == "}":
+            if stack.pop():
+                edits.append((token.start, token.end, ""))
+            if not stack:
+                root_closed_at = i
+                break
+        elif token.kind == "edgeop" and (token.value == "->") != directed:
+            edits.append((token.start, token.end, "->" if directed else "--"))
+            fixes.append(f"replaced edge operator {token.value!r}")
+        elif token.kind == "punct" and token.value == "=" and i + 1 < len(tokens):
+            end = _value_end(text, tokens, i + 1)
+            if end == i + 1:
+                edits.append((token.end, token.end, '""'))
+                fixes.append("added a missing attribute value")
+            elif end > i + 2 or not is_id(tokens[i + 1]):
+                raw = text[tokens[i + 1].start:tokens[end - 1].end]
+                edits.append((tokens[i + 1].start, tokens[end - 1].end, _quote(raw)))
+                fixes.append(f"quoted attribute value {raw!r}")
+                i = end
+                continue
+        i += 1
+
+    if root_closed_at is None:
+        missing = sum(1 for duplicate in stack if not duplicate)
+        edits.append((len(text), len(text), "\n" + "}" * missing))
+        fixes.append(f"added {missing} missing closing brace{'s' if missing > 1 else ''}")
+    elif root_closed_at + 1 < len(tokens):
+        rest = tokens[root_closed_at + 1:]
+        edits.append((tokens[root_closed_at].end, len(text), ""))
+        if all(t.value == "}" for t in rest):
+            fixes.append("removed extra closing braces")
+        else:
+            fixes.append("removed content after the graph")
+
+    for edit_start, edit_end, replacement in sorted(edits, reverse=True):
+        text = text[:edit_start] + replacement + text[edit_end:]
+    return text
+
+
+def repair_dot(text: str) -> RepairResult:
+    """Validate DOT code, fixing common defects in LLM output.
+
+    Handles stray code fences and language tags, text around the graph,
+    duplicate graph headers, unbalanced braces, unterminated strings,
+    mismatched edge operators and unquoted attribute values.
+    """
+    try:
+        validate(text)
+        return RepairResult(text, [], None)
+    except DotSyntaxError:
+        pass
+    fixes = []
+    lines = text.strip().splitlines()
+    kept = [line for line in lines if not _FENCE_RE.match(line)]
+    if kept and _LANGUAGE_TAG_RE.match(kept[0]):
+        kept = kept[1:]
+    if len(kept) != len(lines):
+        fixes.append("removed code fences or a language tag")
+    repaired = "\n".join(kept)
+    # e.g. "dot digraph G {" left over from fence stripping
+    repaired, count = re.subn(r"^\s*(?:dot|graphviz)\s+(?=(?:strict\s+)?(?:di)?graph\b)", "", repaired,
+                              flags=re.IGNORECASE)
+    if count:
+        fixes.append("removed a language tag")
+    # A couple of passes: closing a string can reveal further defects
+    for _ in range(3):
+        repaired = _repair_tokens(repaired, fixes)
+        try:
+            validate(repaired)
+            return RepairResult(repaired, fixes, None)
+        except DotSyntaxError as e:
+            error = str(e)
+    return RepairResult(repaired, fixes, error)
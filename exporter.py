@@ -1,52 +1,386 @@
 import os
-import uuid
-from graphviz import Source
-import os
-from dotenv import load_dotenv
-load_dotenv()
-OUTPUT_DIR = os.getenv("OUTPUT_DIR")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+import time
+import atexit
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Optional
+from cache import RenderCache, render_key
+from config import getenv
+from metrics import counter, register_callback, span
+from singleflight import SingleFlight
+
+RENDERS = counter("renders_total", "Renders by format and outcome (cached, coalesced, layout_reused, full, error)")
+PREFETCH_ERRORS = counter("render_prefetch_errors_total", "Background export renders that failed")
+LAYOUT_FALLBACKS = counter("render_layout_fallbacks_total", "Renders that fell back from layout reuse to a full layout")
+
+# Importing this module has no side effects: settings are read, Graphviz is
+# imported and OUTPUT_DIR is created on first use.
+
+def get_output_dir() -> Optional[str]:
+    return getenv("OUTPUT_DIR")
+
+@lru_cache(maxsize=None)
+def get_artifact_store():
+    """Content-addressed store for files in OUTPUT_DIR, or None when it is not set."""
+    from artifacts import ArtifactStore
+    if not get_output_dir():
+        return None
+    store = ArtifactStore(get_output_dir(), compression=getenv("ARTIFACT_COMPRESSION", "auto"))
+    for stat in ("artifacts", "bytes", "stored_bytes"):
+        register_callback(f"artifact_store_{stat}", f"Artifact store {stat.replace('_', ' ')}",
+                          lambda stat=stat: store.stats()[stat])
+    register_callback("artifact_store_dedup_hits_total", "Artifact writes skipped because the bytes were stored",
+                      lambda: store.dedup_hits, kind="counter")
+    return store
+
+@lru_cache(maxsize=None)
+def get_render_cache() -> RenderCache:
+    """Rendered charts keyed by a hash of the DOT source, format and DPI."""
+    render_cache = RenderCache(
+        get_artifact_store(),
+        max_bytes=int(getenv("RENDER_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    )
+    for stat in ("hits", "disk_hits", "misses"):
+        register_callback(f"render_cache_{stat}_total", f"Render cache {stat.replace('_', ' ')}",
+                          lambda stat=stat: render_cache.stats()[stat], kind="counter")
+    register_callback("render_cache_bytes", "Bytes held by the in-memory render cache",
+                      lambda: render_cache.stats()["bytes"])
+    return render_cache
+
+_render_flights = None
+_render_flights_lock = threading.Lock()
+
+def get_render_flights() -> SingleFlight:
+    """Concurrent renders (and layouts) of the same chart share one Graphviz run.
+
+    Created under a lock: ``lru_cache`` lets concurrent first calls build
+    separate groups, which would not coalesce with each other.
+    """
+    global _render_flights
+    with _render_flights_lock:
+        if _render_flights is None:
+            _render_flights = SingleFlight("render", timeout=float(getenv("COALESCE_TIMEOUT", 120)))
+        return _render_flights
+
+@lru_cache(maxsize=None)
+def get_janitor():
+    """Background janitor expiring files in OUTPUT_DIR, started on first use."""
+    from janitor import OutputJanitor
+    if not get_output_dir():
+        raise RuntimeError("OUTPUT_DIR is not set; there are no output files to expire")
+    max_bytes = int(getenv("OUTPUT_MAX_BYTES", 0)) or None
+    janitor = OutputJanitor(
+        get_output_dir(),
+        max_age=float(getenv("OUTPUT_MAX_AGE_HOURS", 1)) * 3600,
+        max_bytes=max_bytes,
+        on_delete=get_artifact_store().discard,
+    )
+    janitor.start()
+    register_callback("output_dir_bytes", "Bytes of tracked files in OUTPUT_DIR", lambda: janitor.stats()["bytes"])
+    register_callback("output_dir_files", "Tracked files in OUTPUT_DIR", lambda: janitor.stats()["files"])
+    register_callback("output_dir_deleted_total", "Files deleted by the janitor",
+                      lambda: janitor.stats()["deleted"], kind="counter")
+    return janitor
+
+def __getattr__(name: str):
+    # Keeps exporter.OUTPUT_DIR and exporter.render_cache working as lazy attributes
+    if name == "OUTPUT_DIR":
+        return get_output_dir()
+    if name == "render_cache":
+        return get_render_cache()
+    if name == "artifact_store":
+        return get_artifact_store()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def save_dot_file(dot_code: str) -> str:
-    path = os.path.join(OUTPUT_DIR, f"{uuid.uuid4().hex}.dot")
-    with open(path, "w") as f:
-        f.write(dot_code)
-    return path
-
-def render_dot(dot_code: str, fmt: str = "png") -> str:
-    base_name = f"{uuid.uuid4().hex}"
-    path = os.path.join(OUTPUT_DIR, base_name)
-    graph_code = dot_code
-    if fmt == "png":
-        # Inject DPI setting into DOT code for higher quality PNG
-        lines = dot_code.splitlines()
-        for i, line in enumerate(lines):
-            if line.strip().startswith("graph") or line.strip().startswith("digraph"):
-                # Insert dpi after opening bracket
-                if "{" in line:
-                    idx = line.index("{") + 1
-                    lines[i] = line[:idx] + "\ngraph [dpi=200];" + line[idx:]
-                else:
-                    lines[i] = line + " {\ngraph [dpi=200];"
-                break
-        graph_code = "\n".join(lines)
-    graph = Source(graph_code)
-    graph.format = fmt
-    if fmt == "png":
-        png_path = path + ".png"
-        png_bytes = graph.pipe(format="png")
-        with open(png_path, "wb") as f:
-            f.write(png_bytes)
-        return png_path
-    return graph.render(path, cleanup=True)
+    """Store DOT code in OUTPUT_DIR (once per unique content), returning the path of the .dot file."""
+    if not get_output_dir():
+        raise RuntimeError("OUTPUT_DIR is not set; there is nowhere to save DOT files")
+    with span("save_dot_file"):
+        data = dot_code.encode("utf-8")
+        artifact = get_artifact_store().put(data, "dot", name=f"dot:{hashlib.sha256(data).hexdigest()}",
+                                            compress=False)
+    get_janitor().track(artifact.path)
+    return artifact.path
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+def get_render_pool():
+    """Shared pool of Graphviz workers, started on first use."""
+    from workers import GraphvizPool
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = GraphvizPool(
+                processes=int(getenv("RENDER_POOL_SIZE", 0)) or None,
+                max_jobs=int(getenv("RENDER_POOL_MAX_JOBS", 200)),
+                timeout=float(getenv("RENDER_TIMEOUT", 30)),
+            )
+            atexit.register(_render_pool.close)
+        return _render_pool
+
+def _pipe_subprocess(graph_code: str, fmt: str, engine: str = "dot", dpi: Optional[int] = None) -> bytes:
+    from workers import run_graphviz
+    return run_graphviz(graph_code, fmt, engine, dpi)
+
+def _pipe_pool(graph_code: str, fmt: str, engine: str = "dot", dpi: Optional[int] = None) -> bytes:
+    from workers import has_pygraphviz
+    if not has_pygraphviz():
+        # Workers would only spawn the same dot process, plus IPC
+        return _pipe_subprocess(graph_code, fmt, engine, dpi)
+    return get_render_pool().render(graph_code, fmt, engine, dpi)
+
+# Rendering backends selectable per call or through RENDER_BACKEND, called
+# as pipe(graph_code, fmt, engine, dpi); DPI is a -Gdpi option, not DOT code
+RENDER_BACKENDS = {
+    "subprocess": _pipe_subprocess,
+    "pool": _pipe_pool,
+}
+
+def _pipe_formats_subprocess(graph_code: str, formats, engine: str = "dot", dpi: Optional[int] = None) -> dict:
+    from workers import run_graphviz_formats
+    return run_graphviz_formats(graph_code, formats, engine, dpi)
+
+# Backends that can render several formats from one Graphviz run, called as
+# pipe_formats(graph_code, formats, engine, dpi) -> {format: bytes}; the pool
+# renders in-process, so it gains nothing from batching formats
+MULTI_FORMAT_BACKENDS = {
+    "subprocess": _pipe_formats_subprocess,
+}
+
+# Engines a graph may select with its ``layout`` attribute (see stylist.tune_layout)
+LAYOUT_ENGINES = {"dot", "neato", "fdp", "sfdp", "osage", "circo", "twopi", "patchwork"}
+
+def layout_engine(graph) -> str:
+    engine = graph.attrs.get("layout", "dot")
+    return engine if engine in LAYOUT_ENGINES else "dot"
+
+def get_layout(graph, pipe=None):
+    """Positioned copy of a parsed graph, reusing the layout of any earlier
+    revision that differs only in paint attributes (colors, styles, ...)."""
+    from dotparse import parse_dot
+    pipe = pipe or RENDER_BACKENDS[getenv("RENDER_BACKEND", "subprocess")]
+    key = render_key(graph.layout_signature(), "layout", None)
+    render_cache = get_render_cache()
+    positioned = render_cache.get(key, "layout")
+    if positioned is None:
+        positioned, _ = get_render_flights().do(key, partial(_layout, graph, pipe, key))
+    return graph.with_layout(parse_dot(positioned.decode("utf-8")))
+
+def _layout(graph, pipe, key: str) -> bytes:
+    with span("render.layout"):
+        positioned = pipe(graph.to_dot(), "dot", layout_engine(graph))
+    get_render_cache().put(key, "layout", positioned)
+    return positioned
+
+def _positioned(dot_code: str, pipe):
+    from dotparse import parse_dot
+    with span("render.parse"):
+        graph = parse_dot(dot_code)
+    return get_layout(graph, pipe)
+
+def _draw(graph, fmt: str, dpi: Optional[int], pipe) -> bytes:
+    """Render a positioned graph without another layout pass."""
+    graph_code = graph.to_dot()
+    with span("render.draw", format=fmt):
+        return pipe(graph_code, fmt, "nop2", dpi)
+
+def _render(dot_code: str, fmt: str, dpi: int, backend: Optional[str] = None, layout=None) -> tuple:
+    # DPI only affects raster output, so other formats share one cache entry
+    dpi = (dpi or get_export_dpi()) if fmt == "png" else None
+    key = render_key(dot_code, fmt, dpi)
+    render_cache = get_render_cache()
+    data = render_cache.get(key, fmt)
+    if data is not None:
+        RENDERS.inc(format=fmt, outcome="cached")
+        return key, data
+    # Identical renders already running (e.g. many sessions opening the same
+    # example) wait for that one instead of starting their own Graphviz run
+    data, shared = get_render_flights().do(key, partial(_render_uncached, dot_code, fmt, dpi, backend, layout, key))
+    if shared:
+        RENDERS.inc(format=fmt, outcome="coalesced")
+    return key, data
+
+def _render_uncached(dot_code: str, fmt: str, dpi: Optional[int], backend: Optional[str], layout,
+                     key: str) -> bytes:
+    pipe = RENDER_BACKENDS[backend or getenv("RENDER_BACKEND", "subprocess")]
+    data = None
+    outcome = "layout_reused"
+    if layout is not None or getenv("RENDER_REUSE_LAYOUT", "1") != "0":
+        try:
+            graph = layout() if layout is not None else _positioned(dot_code, pipe)
+            data = _draw(graph, fmt, dpi, pipe)
+        except Exception:
+            # Unparseable input or a Graphviz error: fall back to a full render
+            LAYOUT_FALLBACKS.inc(format=fmt)
+            data = None
+    if data is None:
+        from dotparse import parse_dot
+        outcome = "full"
+        try:
+            engine = layout_engine(parse_dot(dot_code))
+        except ValueError:
+            engine = "dot"
+        try:
+            with span("render.full", format=fmt):
+                data = pipe(dot_code, fmt, engine, dpi)
+        except Exception:
+            RENDERS.inc(format=fmt, outcome="error")
+            raise
+    RENDERS.inc(format=fmt, outcome=outcome)
+    get_render_cache().put(key, fmt, data)
+    return data
+
+def render_formats(dot_code: str, formats=("png", "pdf", "svg"), dpi: Optional[int] = None,
+                   backend: Optional[str] = None) -> dict:
+    """Render DOT code to several formats from a single Graphviz layout.
+
+    Returns the bytes of each format; formats already in the render cache
+    are not rendered again. When the chart's layout is cached, each format
+    is drawn from it; otherwise the missing formats (and the layout, for
+    later edits) come out of one Graphviz run. PNGs use ``dpi``, by default
+    EXPORT_DPI.
+    """
+    name = backend or getenv("RENDER_BACKEND", "subprocess")
+    renders = {}
+    if name in MULTI_FORMAT_BACKENDS:
+        renders = _render_together(dot_code, formats, dpi, MULTI_FORMAT_BACKENDS[name])
+    # Laid out on the first cache miss, then shared by the remaining formats
+    layout = lru_cache(maxsize=None)(partial(_positioned, dot_code, RENDER_BACKENDS[name]))
+    for fmt in formats:
+        if fmt not in renders:
+            renders[fmt] = _render(dot_code, fmt, dpi, backend, layout)[1]
+    return {fmt: renders[fmt] for fmt in formats}
+
+def _render_together(dot_code: str, formats, dpi: Optional[int], pipe_formats) -> dict:
+    """Cached formats, plus the missing ones rendered in one Graphviz run per
+    DPI, unless the layout is cached (drawing from it is cheaper then)."""
+    from dotparse import parse_dot
+    render_cache = get_render_cache()
+    renders, groups = {}, {}
+    for fmt in dict.fromkeys(formats):
+        fmt_dpi = (dpi or get_export_dpi()) if fmt == "png" else None
+        key = render_key(dot_code, fmt, fmt_dpi)
+        data = render_cache.get(key, fmt)
+        if data is not None:
+            RENDERS.inc(format=fmt, outcome="cached")
+            renders[fmt] = data
+        else:
+            groups.setdefault(fmt_dpi, {})[fmt] = key
+    if not groups:
+        return renders
+    try:
+        graph = parse_dot(dot_code)
+    except ValueError:
+        graph = None
+    engine = layout_engine(graph) if graph is not None else "dot"
+    layout_key = None
+    if graph is not None and getenv("RENDER_REUSE_LAYOUT", "1") != "0":
+        layout_key = render_key(graph.layout_signature(), "layout", None)
+        if render_cache.get(layout_key, "layout") is not None:
+            return renders
+    for fmt_dpi, keys in groups.items():
+        # The positioned graph (-Tdot) rides along with the DPI-less formats
+        extra = ["dot"] if layout_key and (fmt_dpi is None or None not in groups) else []
+        flight = render_key(dot_code, "+".join([*keys, *extra]), fmt_dpi)
+        try:
+            with span("render.formats", formats=",".join(keys)):
+                outputs, _ = get_render_flights().do(
+                    flight, partial(pipe_formats, dot_code, [*keys, *extra], engine, fmt_dpi))
+        except Exception:
+            for fmt in keys:
+                RENDERS.inc(format=fmt, outcome="error")
+            raise
+        for fmt, key in keys.items():
+            RENDERS.inc(format=fmt, outcome="full")
+            render_cache.put(key, fmt, outputs[fmt])
+            renders[fmt] = outputs[fmt]
+        if extra:
+            render_cache.put(layout_key, "layout", outputs["dot"])
+            layout_key = None
+    return renders
+
+def render_bytes(dot_code: str, fmt: str = "png", dpi: Optional[int] = None, backend: Optional[str] = None) -> bytes:
+    """Render DOT code in memory, without touching the filesystem."""
+    return _render(dot_code, fmt, dpi, backend)[1]
+
+def get_export_dpi() -> int:
+    """Default resolution of PNG exports."""
+    return int(getenv("EXPORT_DPI", 200))
+
+def render_preview(dot_code: str, backend: Optional[str] = None) -> tuple:
+    """Quick render for on-screen display, returning (format, bytes).
+
+    SVG by default (PREVIEW_FORMAT), or PNG at PREVIEW_DPI; either way the
+    layout is cached, so exports drawn later skip the layout pass.
+    """
+    fmt = getenv("PREVIEW_FORMAT", "svg")
+    return fmt, _render(dot_code, fmt, int(getenv("PREVIEW_DPI", 72)), backend)[1]
+
+@lru_cache(maxsize=None)
+def get_prefetch_executor() -> ThreadPoolExecutor:
+    """Threads rendering exports in the background, started on first use."""
+    return ThreadPoolExecutor(max_workers=int(getenv("PREFETCH_WORKERS", 2)), thread_name_prefix="render-prefetch")
+
+def prefetch(dot_code: str, formats=("png", "pdf", "svg"), dpi: Optional[int] = None,
+             backend: Optional[str] = None) -> Future:
+    """Start rendering exports in the background, so a later render_formats
+    call with the same arguments is served from the render cache (or joins
+    the render still running). Returns the future of the render_formats call.
+    """
+    future = get_prefetch_executor().submit(render_formats, dot_code, formats, dpi, backend)
+    future.add_done_callback(_count_prefetch_error)
+    return future
+
+def _count_prefetch_error(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        PREFETCH_ERRORS.inc()
+
+def render_artifact(dot_code: str, fmt: str = "png", dpi: Optional[int] = None, backend: Optional[str] = None):
+    """Render DOT code and persist it to the artifact store in OUTPUT_DIR, returning the Artifact.
+
+    Artifacts are content-addressed, so a chart exported any number of
+    times is stored once; SVG is stored compressed.
+    """
+    if not get_output_dir():
+        raise RuntimeError("OUTPUT_DIR is not set; use render_bytes for in-memory rendering")
+    return _persist(*_render(dot_code, fmt, dpi, backend), fmt)
+
+def save_render(dot_code: str, fmt: str, data: bytes, dpi: Optional[int] = None):
+    """Persist bytes already rendered from DOT code (e.g. by render_formats or
+    the HTTP API) to the artifact store in OUTPUT_DIR, returning the Artifact."""
+    if not get_output_dir():
+        raise RuntimeError("OUTPUT_DIR is not set; there is nowhere to save renders")
+    dpi = (dpi or get_export_dpi()) if fmt == "png" else None
+    return _persist(render_key(dot_code, fmt, dpi), data, fmt)
+
+def _persist(key: str, data: bytes, fmt: str, compress: bool = True):
+    with span("render.persist", format=fmt):
+        artifact = get_render_cache().persist(key, fmt, data, compress)
+    get_janitor().track(artifact.path)
+    return artifact
+
+def render_dot(dot_code: str, fmt: str = "png", dpi: Optional[int] = None, backend: Optional[str] = None) -> str:
+    """Render DOT code and persist it to OUTPUT_DIR, returning the path of the
+    image file (stored uncompressed, so it can be opened as it is)."""
+    if not get_output_dir():
+        raise RuntimeError("OUTPUT_DIR is not set; use render_bytes for in-memory rendering")
+    return _persist(*_render(dot_code, fmt, dpi, backend), fmt, compress=False).path
 
 def cleanup_old_outputs(hours: int = 1):
-    """Delete files in OUTPUT_DIR older than the given number of hours."""
-    now = os.path.getmtime if os.name == 'nt' else os.path.getctime
-    cutoff = (os.path.getmtime if os.name == 'nt' else os.path.getctime)(__file__)
-    cutoff = cutoff - hours * 3600
-    for filename in os.listdir(OUTPUT_DIR):
-        file_path = os.path.join(OUTPUT_DIR, filename)
+    """Delete files in OUTPUT_DIR older than the given number of hours.
+
+    One-off full scan; a running server relies on get_janitor() instead.
+    """
+    cutoff = time.time() - hours * 3600
+    output_dir = get_output_dir()
+    if not output_dir or not os.path.isdir(output_dir):
+        return
+    for filename in os.listdir(output_dir):
+        file_path = os.path.join(output_dir, filename)
         if os.path.isfile(file_path):
             file_time = os.path.getmtime(file_path)
             if file_time < cutoff:
@@ -54,6 +388,3 @@ def cleanup_old_outputs(hours: int = 1):
                     os.remove(file_path)
                 except Exception:
                     pass
-
-# Run cleanup at startup
-cleanup_old_outputs(hours=1)
@@ -1,15 +1,28 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
 import os
-from dotenv import load_dotenv
+import re
+import time
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, Optional
+from cache import PromptCache
+from config import getenv
+from large_graph import is_large, merge_stages, outline, split_stages, stage_title
+from llm_backends import DEFAULT_MODELS, LLM_BACKENDS, get_backend_name, get_model_name
+from metrics import counter, histogram, span
+from singleflight import SingleFlight
+from stylist import style_dot, style_graph, tune_dot, tune_layout
 
-load_dotenv()
+GENERATIONS = counter("generations_total", "Generations by outcome (cached, coalesced, valid, invalid)")
+LLM_TOKENS = counter("llm_tokens_total", "LLM tokens by kind (prompt, completion)")
+LLM_TTFT = histogram("llm_ttft_seconds", "Time to the first token of a generation")
+# Streamed generations are measured here rather than by a span, which would
+# also time the consumer between chunks
+GENERATION_SECONDS = histogram("generation_duration_seconds", "Total generation time by outcome")
 
-os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
 
-
-prompt = PromptTemplate.from_template("""
+PROMPT_TEMPLATE = """
 You are an expert system that converts natural language descriptions of processes or workflows into Graphviz DOT code for generating flowcharts. Your output must be valid Graphviz DOT code, strictly adhering to these guidelines:
 
 1. Graph Structure:
@@ -72,23 +85,590 @@ User Description:
 
 Output:
 Provide only the valid Graphviz DOT code, enclosed in a code block (```), without additional explanations or comments unless requested.
-""")
+"""
+
+# Structure-only prompt: styling is applied locally by stylist.style_graph
+COMPACT_PROMPT_TEMPLATE = """
+Convert the process description below into Graphviz DOT code for a flowchart.
+- digraph named Flowchart unless the description names it.
+- rankdir LR by default, TB for long sequential flows; a direction in the description takes precedence.
+- Group related steps into clusters (subgraph cluster_<name>) with a descriptive label, e.g. input, processing and output stages.
+- One node per step with a short label; label edges with the action or transition.
+- Exported or saved files get their own node, e.g. "Exported PNG".
+- Add colors, shapes or fonts only if the description asks for them.
+
+Description:
+{user_input}
+
+Return only the DOT code in a code block (```).
+"""
+
+PROMPT_TEMPLATES = {
+    "full": PROMPT_TEMPLATE,
+    "compact": COMPACT_PROMPT_TEMPLATE,
+}
+
+# Sent only when local repair cannot fix the generated code
+REPAIR_TEMPLATE = """
+The following Graphviz DOT code is invalid: {error}
+
+{dot_code}
+
+Return only the corrected DOT code, enclosed in a code block (```), keeping the graph otherwise unchanged.
+"""
+
+# One stage of a long description in large-graph mode; styling is applied
+# locally to the merged graph
+STAGE_PROMPT_TEMPLATE = """
+Convert one stage of a larger process into Graphviz DOT code.
+The whole process has these stages: {outline}
+This is stage {number}: {title}.
+- A digraph with a single cluster (subgraph cluster_stage) for this stage; nest clusters only for distinct components.
+- One node per step with a short label; label edges with the action or transition.
+- Only the steps of this stage, in order; the stages are connected afterwards.
+- Add colors, shapes or fonts only if the description asks for them.
+
+Description:
+{stage}
+
+Return only the DOT code in a code block (```).
+"""
+
+def prompt_version(mode: str = "full") -> str:
+    """Changes whenever a template is edited, invalidating cached responses."""
+    return hashlib.sha256(PROMPT_TEMPLATES[mode].encode("utf-8")).hexdigest()[:12]
+
+
+PROMPT_VERSION = prompt_version()
+
+# Default model; LLM_BACKEND and LLM_MODEL select another (see llm_backends.py)
+MODEL_NAME = DEFAULT_MODELS["gemini"]
+
+# Importing this module has no side effects: LangChain and the LLM client
+# are imported and built on first use.
+
+def get_prompt_mode() -> str:
+    """PROMPT_MODE: "full" spells out all styling rules, "compact" leaves them to the stylist."""
+    mode = getenv("PROMPT_MODE", "full")
+    if mode not in PROMPT_TEMPLATES:
+        raise ValueError(f"PROMPT_MODE must be one of {', '.join(PROMPT_TEMPLATES)}, not {mode!r}")
+    return mode
+
+
+@lru_cache(maxsize=None)
+def get_prompt(mode: Optional[str] = None):
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate.from_template(PROMPT_TEMPLATES[mode or get_prompt_mode()])
+
+
+@lru_cache(maxsize=None)
+def get_llm():
+    return LLM_BACKENDS[get_backend_name()](get_model_name())
+
+
+@lru_cache(maxsize=None)
+def get_message_chain(mode: Optional[str] = None):
+    """Generation chain returning the model's message, which carries token usage."""
+    return get_prompt(mode) | get_llm()
+
+
+@lru_cache(maxsize=None)
+def get_chain(mode: Optional[str] = None):
+    """The LCEL (LangChain Expression Language) generation chain."""
+    from langchain_core.output_parsers import StrOutputParser
+    return get_message_chain(mode) | StrOutputParser()
+
+
+@lru_cache(maxsize=None)
+def get_repair_chain():
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate.from_template(REPAIR_TEMPLATE) | get_llm()
+
+
+@lru_cache(maxsize=None)
+def get_stage_chain():
+    """Large-graph mode: one stage of a long description to a cluster."""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate.from_template(STAGE_PROMPT_TEMPLATE) | get_llm()
+
+
+_generation_flights = None
+_generation_flights_lock = threading.Lock()
+
+
+def get_generation_flights() -> SingleFlight:
+    """Concurrent generations for the same description share one LLM call
+    (created under a lock so concurrent first calls get the same group)."""
+    global _generation_flights
+    with _generation_flights_lock:
+        if _generation_flights is None:
+            _generation_flights = SingleFlight("generate", timeout=float(getenv("COALESCE_TIMEOUT", 120)))
+        return _generation_flights
+
+
+@lru_cache(maxsize=None)
+def get_prompt_cache() -> PromptCache:
+    """Responses for repeated (or near-identical) descriptions survive restarts."""
+    return PromptCache(
+        getenv("PROMPT_CACHE_PATH", os.path.join(".cache", "prompt_cache.sqlite3")),
+        namespace=f"{get_backend_name()}:{get_model_name()}:{prompt_version(get_prompt_mode())}",
+        ttl=float(getenv("PROMPT_CACHE_TTL", 7 * 24 * 3600)),
+        max_entries=int(getenv("PROMPT_CACHE_MAX_ENTRIES", 10000)),
+        similarity=float(getenv("PROMPT_CACHE_SIMILARITY", 0)),
+    )
+
+
+_LAZY_ATTRIBUTES = {
+    "prompt": get_prompt,
+    "llm": get_llm,
+    "chain": get_chain,
+    "prompt_cache": get_prompt_cache,
+}
+
+
+def __getattr__(name: str):
+    # Keeps flowchart.chain, flowchart.llm, ... working as lazy attributes
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+_DOT_HEADER_WORDS = {"strict", "graph", "digraph"}
+
+
+class DotStreamParser:
+    """Strips Markdown code fences from model output as it streams in.
+
+    ``feed`` returns the DOT text that became available with each chunk and
+    ``close`` flushes whatever was held back; the cleaned code accumulates
+    in ``text``.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._buffer = ""
+        self._state = "start"
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        emitted = ""
+        if self._state == "start":
+            head = self._buffer.lstrip()
+            if not head or (len(head) < 3 and "```".startswith(head)):
+                return ""
+            if head.startswith("```"):
+                self._state = "tag"
+                self._buffer = head[3:]
+            else:
+                self._state = "plain"
+                self._buffer = head
+        if self._state == "tag":
+            # Drop a language tag such as "dot" after the opening fence, which
+            # may be followed by a newline or, on one line, by the code itself
+            head = self._buffer.lstrip(" \t")
+            tag = re.match(r"[\w+-]*", head).group()
+            if len(tag) == len(head):
+                return ""
+            if tag and (not head[len(tag)].isspace() or tag.lower() in _DOT_HEADER_WORDS):
+                self._buffer = head  # no tag: the code starts right after the fence
+            else:
+                rest = head[len(tag):].lstrip(" \t")
+                self._buffer = rest[1:] if rest.startswith("\n") else rest
+            self._state = "body"
+        if self._state == "body":
+            end = self._buffer.find("```")
+            if end != -1:
+                emitted, self._buffer = self._buffer[:end], ""
+                self._state = "done"
+            else:
+                # Hold back trailing backticks that may start the closing fence
+                held = len(self._buffer) - len(self._buffer.rstrip("`"))
+                emitted = self._buffer[:len(self._buffer) - held]
+                self._buffer = self._buffer[len(emitted):]
+        elif self._state == "plain":
+            emitted, self._buffer = self._buffer, ""
+        elif self._state == "done":
+            self._buffer = ""
+        self.text += emitted
+        return emitted
+
+    def close(self) -> str:
+        emitted = ""
+        if self._state in ("start", "plain", "body"):
+            emitted = self._buffer.lstrip() if self._state == "start" else self._buffer
+        elif self._state == "tag" and not re.fullmatch(r"[\w+-]*", self._buffer.strip()):
+            emitted = self._buffer
+        self._buffer = ""
+        self._state = "done"
+        self.text += emitted
+        return emitted
+
+
+def clean_dot_output(raw_output: str) -> str:
+    """Remove Markdown code fences and a language tag from model output."""
+    parser = DotStreamParser()
+    parser.feed(raw_output)
+    parser.close()
+    return parser.text.strip()
+
+
+@dataclass
+class Generation:
+    """Details of one generation call, filled in when passed to the generate functions.
+
+    Token counts add up every LLM call made (including a repair re-ask).
+    ``ttft`` is the time to the first streamed chunk, or to the whole
+    response when not streaming; times are in seconds. A ``coalesced``
+    generation shared the result of an identical concurrent one and made
+    no LLM call itself.
+    """
+    dot_code: str = ""
+    cached: bool = False
+    coalesced: bool = False
+    repairs: list = field(default_factory=list)
+    reasked: bool = False
+    error: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    ttft: Optional[float] = None
+    total_time: Optional[float] = None
+    started_at: float = field(default=0.0, repr=False)
+
+    def first_token(self) -> None:
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started_at
+
+    def finish(self) -> None:
+        self.total_time = time.perf_counter() - self.started_at
+
 
+def _message_text(message) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    # Content blocks, as returned by some chat models
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
 
-# Initialize the LLM
-llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash")
 
-# Create the chain using LCEL (LangChain Expression Language)
-chain = prompt | llm | StrOutputParser()
+def _account(message, generation: Generation) -> str:
+    usage = getattr(message, "usage_metadata", None) or {}
+    generation.prompt_tokens += usage.get("input_tokens", 0)
+    generation.completion_tokens += usage.get("output_tokens", 0)
+    return _message_text(message)
+
+
+def _repair(dot_code: str, generation: Generation):
+    from dotparse import repair_dot
+    result = repair_dot(dot_code)
+    generation.repairs.extend(result.fixes)
+    return result
+
+
+def _finish(result, generation: Generation) -> str:
+    dot_code = result.dot
+    if result.ok:
+        if get_prompt_mode() == "compact":
+            dot_code = style_dot(dot_code)
+        dot_code = tune_dot(dot_code)
+    generation.dot_code, generation.error = dot_code, result.error
+    return dot_code
+
+
+def finalize_dot_code(dot_code: str, generation: Optional[Generation] = None) -> str:
+    """Validate and repair generated DOT code, re-asking the LLM only if repair fails."""
+    generation = generation if generation is not None else Generation()
+    result = _repair(dot_code, generation)
+    if not result.ok:
+        generation.reasked = True
+        with span("llm.repair"):
+            message = get_repair_chain().invoke({"dot_code": result.dot, "error": result.error})
+        result = _repair(clean_dot_output(_account(message, generation)), generation)
+    return _finish(result, generation)
+
+
+async def afinalize_dot_code(dot_code: str, generation: Optional[Generation] = None) -> str:
+    """Async variant of finalize_dot_code; parsing and repair run in a thread, off the event loop."""
+    import asyncio
+    generation = generation if generation is not None else Generation()
+    result = await asyncio.to_thread(_repair, dot_code, generation)
+    if not result.ok:
+        generation.reasked = True
+        with span("llm.repair"):
+            message = await get_repair_chain().ainvoke({"dot_code": result.dot, "error": result.error})
+        result = await asyncio.to_thread(_repair, clean_dot_output(_account(message, generation)), generation)
+    return await asyncio.to_thread(_finish, result, generation)
+
+
+def _stage_config() -> dict:
+    return {"max_concurrency": int(getenv("LARGE_GRAPH_CONCURRENCY", 4))}
+
+
+def _stage_inputs(stages: list) -> list:
+    overview = outline(stages)
+    return [
+        {"outline": overview, "number": number, "title": stage_title(stage), "stage": stage}
+        for number, stage in enumerate(stages, 1)
+    ]
+
+
+def _stage_fragment(number: int, stage: str, message) -> str:
+    if isinstance(message, Exception):
+        return ""
+    return f"// Stage {number}: {stage_title(stage)}\n{clean_dot_output(_message_text(message))}\n"
+
+
+def _stage_graph(number: int, message, generation: Generation):
+    if isinstance(message, Exception):
+        generation.repairs.append(f"stage {number}: generation failed ({type(message).__name__}), used a placeholder")
+        return None
+    from dotparse import parse_dot, repair_dot
+    result = repair_dot(clean_dot_output(_account(message, generation)))
+    generation.repairs.extend(f"stage {number}: {fix}" for fix in result.fixes)
+    if result.ok:
+        try:
+            return parse_dot(result.dot)
+        except ValueError:
+            pass
+    generation.repairs.append(f"stage {number}: invalid code replaced by a placeholder")
+    return None
+
+
+def _merge_stages(stages: list, messages: list, generation: Generation) -> str:
+    """Large-graph mode: merge the stage responses into one styled, layout-tuned graph."""
+    failures = [m for m in messages if isinstance(m, Exception)]
+    if len(failures) == len(messages):
+        raise failures[0]
+    graphs = [_stage_graph(number, message, generation) for number, message in enumerate(messages, 1)]
+    graph = style_graph(merge_stages(graphs, [stage_title(stage) for stage in stages]))
+    tune_layout(graph)
+    generation.dot_code, generation.error = graph.to_dot(), None
+    return generation.dot_code
+
+
+def _generate_stages(user_input: str, generation: Generation) -> str:
+    stages = split_stages(user_input)
+    with span("llm.generate", mode="stages"):
+        messages = get_stage_chain().batch(_stage_inputs(stages), _stage_config(), return_exceptions=True)
+    generation.first_token()
+    return _merge_stages(stages, messages, generation)
+
+
+async def _agenerate_stages(user_input: str, generation: Generation) -> str:
+    import asyncio
+    stages = split_stages(user_input)
+    with span("llm.generate", mode="stages"):
+        messages = await get_stage_chain().abatch(_stage_inputs(stages), _stage_config(), return_exceptions=True)
+    generation.first_token()
+    return await asyncio.to_thread(_merge_stages, stages, messages, generation)
+
+
+def _stream_stages(user_input: str, generation: Generation) -> Iterator[str]:
+    """Yield each stage's code as its call completes, then merge them."""
+    stages = split_stages(user_input)
+    messages = [None] * len(stages)
+    completed = get_stage_chain().batch_as_completed(_stage_inputs(stages), _stage_config(), return_exceptions=True)
+    for index, message in completed:
+        generation.first_token()
+        messages[index] = message
+        fragment = _stage_fragment(index + 1, stages[index], message)
+        if fragment:
+            yield fragment
+    _merge_stages(stages, messages, generation)
+
+
+async def _astream_stages(user_input: str, generation: Generation) -> AsyncIterator[str]:
+    import asyncio
+    stages = split_stages(user_input)
+    messages = [None] * len(stages)
+    completed = get_stage_chain().abatch_as_completed(_stage_inputs(stages), _stage_config(), return_exceptions=True)
+    async for index, message in completed:
+        generation.first_token()
+        messages[index] = message
+        fragment = _stage_fragment(index + 1, stages[index], message)
+        if fragment:
+            yield fragment
+    await asyncio.to_thread(_merge_stages, stages, messages, generation)
+
+
+def _start(generation: Optional[Generation]) -> Generation:
+    generation = generation if generation is not None else Generation()
+    generation.started_at = time.perf_counter()
+    return generation
+
+
+def _cached(user_input: str, generation: Generation) -> Optional[str]:
+    cached = get_prompt_cache().get(user_input)
+    if cached is not None:
+        generation.cached = True
+        generation.dot_code = cached
+        generation.finish()
+        GENERATIONS.inc(outcome="cached")
+        GENERATION_SECONDS.observe(generation.total_time, outcome="cached")
+    return cached
+
+
+def _coalesced(generation: Generation, leader: Generation) -> str:
+    generation.coalesced = True
+    generation.dot_code = leader.dot_code
+    generation.repairs = list(leader.repairs)
+    generation.reasked = leader.reasked
+    generation.error = leader.error
+    generation.finish()
+    GENERATIONS.inc(outcome="coalesced")
+    GENERATION_SECONDS.observe(generation.total_time, outcome="coalesced")
+    return generation.dot_code
+
+
+def _remember(user_input: str, generation: Generation) -> None:
+    # Code that is still invalid is not cached, so the next request regenerates it
+    if generation.error is None:
+        get_prompt_cache().put(user_input, generation.dot_code)
+    generation.finish()
+    outcome = "valid" if generation.error is None else "invalid"
+    GENERATIONS.inc(outcome=outcome)
+    GENERATION_SECONDS.observe(generation.total_time, outcome=outcome)
+    LLM_TOKENS.inc(generation.prompt_tokens, kind="prompt")
+    LLM_TOKENS.inc(generation.completion_tokens, kind="completion")
+    if generation.ttft is not None:
+        LLM_TTFT.observe(generation.ttft)
+
+
+def _invoke(user_input: str, generation: Generation) -> Iterator[str]:
+    if is_large(user_input):
+        yield _generate_stages(user_input, generation)
+        return
+    with span("llm.generate", mode="invoke"):
+        message = get_message_chain().invoke({"user_input": user_input})
+    generation.first_token()
+    dot_code = clean_dot_output(_account(message, generation))
+    yield dot_code
+    finalize_dot_code(dot_code, generation)
+
+
+def _stream(user_input: str, generation: Generation) -> Iterator[str]:
+    if is_large(user_input):
+        yield from _stream_stages(user_input, generation)
+        return
+    parser = DotStreamParser()
+    for chunk in get_message_chain().stream({"user_input": user_input}):
+        generation.first_token()
+        fragment = parser.feed(_account(chunk, generation))
+        if fragment:
+            yield fragment
+    fragment = parser.close()
+    if fragment:
+        yield fragment
+    finalize_dot_code(parser.text.strip(), generation)
+
+
+def _lead(user_input: str, generation: Generation, produce) -> Iterator[str]:
+    """Body shared by the generate and stream functions.
+
+    Serves a cached result, or the result of an identical generation in
+    flight, as a single fragment; otherwise leads the generation with
+    ``produce`` (which yields raw code fragments and leaves the validated
+    result on ``generation``), then caches the result and hands it to the
+    followers.
+    """
+    cached = _cached(user_input, generation)
+    if cached is not None:
+        yield cached
+        return
+    flight, leader = get_generation_flights().lead_or_wait(get_prompt_cache().key(user_input))
+    if flight is None:
+        yield _coalesced(generation, leader)
+        return
+    with flight:
+        yield from produce(user_input, generation)
+        _remember(user_input, generation)
+        flight.resolve(generation)
+
+
+async def _ainvoke(user_input: str, generation: Generation) -> AsyncIterator[str]:
+    if is_large(user_input):
+        yield await _agenerate_stages(user_input, generation)
+        return
+    with span("llm.generate", mode="invoke"):
+        message = await get_message_chain().ainvoke({"user_input": user_input})
+    generation.first_token()
+    dot_code = clean_dot_output(_account(message, generation))
+    yield dot_code
+    await afinalize_dot_code(dot_code, generation)
+
+
+async def _astream(user_input: str, generation: Generation) -> AsyncIterator[str]:
+    if is_large(user_input):
+        async for fragment in _astream_stages(user_input, generation):
+            yield fragment
+        return
+    parser = DotStreamParser()
+    async for chunk in get_message_chain().astream({"user_input": user_input}):
+        generation.first_token()
+        fragment = parser.feed(_account(chunk, generation))
+        if fragment:
+            yield fragment
+    fragment = parser.close()
+    if fragment:
+        yield fragment
+    await afinalize_dot_code(parser.text.strip(), generation)
+
+
+async def _alead(user_input: str, generation: Generation, produce) -> AsyncIterator[str]:
+    """Async variant of _lead; prompt cache lookups (SQLite) run in threads, off the event loop."""
+    import asyncio
+    cached = await asyncio.to_thread(_cached, user_input, generation)
+    if cached is not None:
+        yield cached
+        return
+    flight, leader = await get_generation_flights().lead_or_wait_async(get_prompt_cache().key(user_input))
+    if flight is None:
+        yield _coalesced(generation, leader)
+        return
+    with flight:
+        async for fragment in produce(user_input, generation):
+            yield fragment
+        await asyncio.to_thread(_remember, user_input, generation)
+        flight.resolve(generation)
+
 
 # ai-flowchart-generator
-def generate_dot_code(user_input: str) -> str:
-    raw_output = chain.invoke({"user_input": user_input})
-    # Remove Markdown code fences if present
-    cleaned = raw_output.strip()
-    if cleaned.startswith("```"):
-        cleaned = cleaned.split("```", 2)[1]  # Get content between first pair of ```
-        # Optionally, remove 'dot' language tag if present
-        if cleaned.strip().startswith("dot"):
-            cleaned = cleaned.strip()[3:].strip()
-    return cleaned
\ No newline at end of file
+def generate_dot_code(user_input: str, generation: Optional[Generation] = None) -> str:
+    """Generate DOT code for a description; pass a Generation to get token counts and timings."""
+    generation = _start(generation)
+    for _ in _lead(user_input, generation, _invoke):
+        pass
+    return generation.dot_code
+
+
+async def agenerate_dot_code(user_input: str, generation: Optional[Generation] = None) -> str:
+    """Async variant of generate_dot_code built on chain.ainvoke.
+
+    Prompt cache lookups (SQLite) and DOT parsing run in threads, so the
+    event loop is never blocked on them.
+    """
+    generation = _start(generation)
+    async for _ in _alead(user_input, generation, _ainvoke):
+        pass
+    return generation.dot_code
+
+
+def stream_dot_code(user_input: str, generation: Optional[Generation] = None) -> Iterator[str]:
+    """Yield DOT code fragments as the model streams its response.
+
+    The fragments are the raw code; the validated and repaired result is
+    left in ``generation.dot_code`` once the stream is exhausted. While an
+    identical generation is in flight, its whole result is yielded at once.
+    """
+    generation = _start(generation)
+    yield from _lead(user_input, generation, _stream)
+
+
+async def astream_dot_code(user_input: str, generation: Optional[Generation] = None) -> AsyncIterator[str]:
+    """Async variant of stream_dot_code built on chain.astream, keeping SQLite and parsing off the loop."""
+    generation = _start(generation)
+    async for fragment in _alead(user_input, generation, _astream):
+        yield fragment
@@ -0,0 +1,208 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from config import getenv
+from metrics import register_callback
+
+
+class HistoryEntry(NamedTuple):
+    token: str
+    prompt: str
+    dot_code: str
+    model: str
+    created_at: float
+    total_time: Optional[float]
+    ttft: Optional[float]
+    prompt_tokens: int
+    completion_tokens: int
+    cached: bool
+    artifacts: dict
+    session: Optional[str]
+
+
+_COLUMNS = ("token, prompt, dot_code, model, created_at, total_time, ttft, prompt_tokens, completion_tokens, "
+            "cached, artifacts, session")
+_JOINED_COLUMNS = ", ".join(f"h.{column}" for column in _COLUMNS.split(", "))
+
+
+class History:
+    """Persistent SQLite history of generated charts.
+
+    Each entry keeps the description, DOT code, model, timings and the
+    artifact hashes of its exports (format -> SHA-256), so a past chart can
+    be reopened without generating it again, from any process sharing the
+    database. Entries belong to a ``session`` (an owner key: a user or a
+    browser session), which scopes ``recent`` and ``search``, and are looked
+    up by a random token, so a chart link cannot be guessed from another.
+    Prompts are searched with an FTS5 index, and the oldest entries are
+    dropped beyond ``max_entries``.
+    """
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = None
+        self._fts = False
+        self._lock = threading.Lock()
+
+    def add(self, prompt: str, dot_code: str, model: str = "", generation=None,
+            artifacts: Optional[dict] = None, session: Optional[str] = None) -> str:
+        """Record a chart; ``generation`` is the flowchart.Generation it came from. Returns its token."""
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT INTO history (token, prompt, dot_code, model, created_at, total_time, ttft, prompt_tokens, "
+                "completion_tokens, cached, artifacts, session) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (token, prompt, dot_code, model, time.time(),
+                 getattr(generation, "total_time", None), getattr(generation, "ttft", None),
+                 getattr(generation, "prompt_tokens", 0), getattr(generation, "completion_tokens", 0),
+                 bool(getattr(generation, "cached", False)), json.dumps(artifacts or {}), session),
+            )
+            overflow = conn.execute("SELECT COUNT(*) FROM history").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute("DELETE FROM history WHERE id IN (SELECT id FROM history ORDER BY id LIMIT ?)",
+                             (overflow,))
+            conn.commit()
+            return token
+
+    def update(self, token: str, dot_code: Optional[str] = None, artifacts: Optional[dict] = None) -> None:
+        """Replace an entry's DOT code (e.g. after an edit) and/or merge artifact hashes into it."""
+        with self._lock:
+            conn = self._connect()
+            if dot_code is not None:
+                conn.execute("UPDATE history SET dot_code = ? WHERE token = ?", (dot_code, token))
+            if artifacts:
+                row = conn.execute("SELECT artifacts FROM history WHERE token = ?", (token,)).fetchone()
+                if row is not None:
+                    merged = {**json.loads(row[0]), **artifacts}
+                    conn.execute("UPDATE history SET artifacts = ? WHERE token = ?", (json.dumps(merged), token))
+            conn.commit()
+
+    def get(self, token: str) -> Optional[HistoryEntry]:
+        with self._lock:
+            row = self._connect().execute(f"SELECT {_COLUMNS} FROM history WHERE token = ?", (token,)).fetchone()
+        return _entry(row) if row else None
+
+    def recent(self, limit: int = 20, session: Optional[str] = None) -> list:
+        """Newest entries first, optionally only those of one session."""
+        where, params = ("WHERE session = ?", (session,)) if session is not None else ("", ())
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {_COLUMNS} FROM history {where} ORDER BY id DESC LIMIT ?", (*params, limit)).fetchall()
+        return [_entry(row) for row in rows]
+
+    def search(self, query: str, limit: int = 20, session: Optional[str] = None) -> list:
+        """Entries whose prompt has a word starting with each word of ``query``, best matches first,
+        optionally only those of one session."""
+        words = query.split()
+        if not words:
+            return self.recent(limit, session)
+        where, params = (" AND h.session = ?", (session,)) if session is not None else ("", ())
+        with self._lock:
+            conn = self._connect()
+            if self._fts:
+                # Quoted, so user input is never parsed as FTS5 query syntax
+                match = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+                rows = conn.execute(
+                    f"SELECT {_JOINED_COLUMNS} "
+                    "FROM history_fts f JOIN history h ON h.id = f.rowid "
+                    f"WHERE history_fts MATCH ?{where} ORDER BY bm25(history_fts), h.id DESC LIMIT ?",
+                    (match, *params, limit),
+                ).fetchall()
+            else:
+                # SQLite built without FTS5: a (slower) scan
+                rows = conn.execute(
+                    f"SELECT {_COLUMNS} FROM history h WHERE {' AND '.join(['prompt LIKE ?'] * len(words))}{where} "
+                    "ORDER BY id DESC LIMIT ?",
+                    (*(f"%{word}%" for word in words), *params, limit),
+                ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def delete(self, token: str) -> None:
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM history WHERE token = ?", (token,))
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connect().execute("SELECT COUNT(*) FROM history").fetchone()[0]
+        return {"entries": entries, "full_text_search": self._fts}
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    token TEXT NOT NULL UNIQUE,
+                    prompt TEXT NOT NULL,
+                    dot_code TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    total_time REAL,
+                    ttft REAL,
+                    prompt_tokens INTEGER NOT NULL,
+                    completion_tokens INTEGER NOT NULL,
+                    cached INTEGER NOT NULL,
+                    artifacts TEXT NOT NULL,
+                    session TEXT
+                );
+                CREATE INDEX IF NOT EXISTS history_session ON history (session, id);
+            """)
+            if "token" not in {row[1] for row in conn.execute("PRAGMA table_info(history)")}:
+                # A database written before entries had tokens
+                conn.execute("ALTER TABLE history ADD COLUMN token TEXT")
+                conn.executemany("UPDATE history SET token = ? WHERE id = ?",
+                                 [(secrets.token_urlsafe(16), row[0])
+                                  for row in conn.execute("SELECT id FROM history").fetchall()])
+                conn.execute("CREATE UNIQUE INDEX history_token ON history (token)")
+                conn.commit()
+            try:
+                # Full-text index over prompts, kept in sync by triggers
+                conn.executescript("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS history_fts
+                        USING fts5(prompt, content='history', content_rowid='id');
+                    CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history
+                    BEGIN
+                        INSERT INTO history_fts (rowid, prompt) VALUES (NEW.id, NEW.prompt);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history
+                    BEGIN
+                        INSERT INTO history_fts (history_fts, rowid, prompt) VALUES ('delete', OLD.id, OLD.prompt);
+                    END;
+                """)
+                self._fts = True
+            except sqlite3.OperationalError:
+                self._fts = False
+            self._conn = conn
+        return self._conn
+
+
+def _entry(row: tuple) -> HistoryEntry:
+    values = list(row)
+    values[9] = bool(values[9])
+    values[10] = json.loads(values[10])
+    return HistoryEntry(*values)
+
+
+@lru_cache(maxsize=None)
+def get_history() -> History:
+    """Chart history stored in HISTORY_PATH, shared by the replicas using the same file."""
+    history = History(
+        getenv("HISTORY_PATH", os.path.join(".cache", "history.sqlite3")),
+        max_entries=int(getenv("HISTORY_MAX_ENTRIES", 10000)),
+    )
+    register_callback("history_entries", "Charts in the persistent history", lambda: history.stats()["entries"])
+    return history
@@ -0,0 +1,145 @@
+import heapq
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+
+class OutputJanitor:
+    """Background thread expiring files in a directory by age and total size.
+
+    Files are registered with ``track`` when they are written. An expiry heap
+    lets the thread sleep until the next file is due and delete only the
+    expired entries, without listing the directory. When ``max_bytes`` is
+    set, the least recently used files are evicted to stay under the quota.
+    ``on_delete`` is called with the paths of each batch of deleted files.
+    """
+
+    def __init__(self, directory: str, max_age: float = 3600, max_bytes: Optional[int] = None,
+                 on_delete: Optional[Callable[[list], None]] = None):
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.on_delete = on_delete
+        self.deleted = 0
+        self.total_bytes = 0
+        self._expiry = []
+        self._expires_at = {}
+        self._sizes = OrderedDict()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def scan(self) -> None:
+        """Index files already present in the directory, e.g. from a previous run."""
+        if not os.path.isdir(self.directory):
+            return
+        with os.scandir(self.directory) as entries:
+            files = [(e.stat().st_mtime, e.path) for e in entries if e.is_file()]
+        # Oldest first so the LRU order follows write time
+        for mtime, path in sorted(files):
+            self.track(path, written_at=mtime)
+
+    def track(self, path: str, written_at: Optional[float] = None) -> None:
+        """Register a written file, or mark an already tracked one as recently used.
+
+        Without ``written_at`` the file counts as written now: a deduplicated
+        write of a tracked file restarts its clock (and its mtime, which
+        ``scan`` reads after a restart). Expiry is only ever pushed back.
+        """
+        if written_at is None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        with self._cond:
+            expires_at = (written_at or time.time()) + self.max_age
+            if path in self._sizes:
+                self._sizes.move_to_end(path)
+                if expires_at > self._expires_at[path]:
+                    # The old heap entry no longer matches and is skipped
+                    self._expires_at[path] = expires_at
+                    heapq.heappush(self._expiry, (expires_at, path))
+                return
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return
+            self._expires_at[path] = expires_at
+            self._sizes[path] = size
+            self.total_bytes += size
+            heapq.heappush(self._expiry, (expires_at, path))
+            self._cond.notify()
+
+    def touch(self, path: str) -> None:
+        with self._cond:
+            if path in self._sizes:
+                self._sizes.move_to_end(path)
+
+    def run_once(self, now: Optional[float] = None) -> int:
+        """Delete expired files and enforce the byte quota; returns the number deleted."""
+        now = time.time() if now is None else now
+        doomed = []
+        with self._cond:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires_at, path = heapq.heappop(self._expiry)
+                # Skip heap entries left behind by files already removed
+                if self._expires_at.get(path) == expires_at:
+                    doomed.append(self._forget(path))
+            if self.max_bytes is not None:
+                while self.total_bytes > self.max_bytes and self._sizes:
+                    doomed.append(self._forget(next(iter(self._sizes))))
+        for path in doomed:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if doomed and self.on_delete is not None:
+            self.on_delete(doomed)
+        with self._cond:
+            self.deleted += len(doomed)
+        return len(doomed)
+
+    def start(self, scan: bool = True) -> None:
+        """Start the background thread, first indexing existing files when ``scan`` is set."""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, args=(scan,), name="output-janitor", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopped = True
+            thread, self._thread = self._thread, None
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"files": len(self._sizes), "bytes": self.total_bytes, "deleted": self.deleted}
+
+    def _forget(self, path: str) -> str:
+        del self._expires_at[path]
+        self.total_bytes -= self._sizes.pop(path)
+        return path
+
+    def _run(self, scan: bool) -> None:
+        if scan:
+            self.scan()
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                over_quota = self.max_bytes is not None and self.total_bytes > self.max_bytes
+                timeout = None
+                if self._expiry and not over_quota:
+                    timeout = max(0.0, self._expiry[0][0] - time.time())
+                if not over_quota and (timeout is None or timeout > 0):
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+            self.run_once()
@@ -0,0 +1,127 @@
+import math
+import re
+
+from config import getenv
+
+# Large-graph mode: a long description is split into stages, each stage is
+# generated as one cluster by a separate (parallel) LLM call, and the
+# clusters are merged into one graph, chained in stage order. This keeps
+# every response short and the time to a chart bounded by the slowest stage.
+# dotgraph is imported by the merge functions only, as splitting does not need it.
+
+_BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+
+
+def get_large_graph_chars() -> int:
+    """Descriptions longer than this (in characters) use large-graph mode; 0 disables it."""
+    return int(getenv("LARGE_GRAPH_CHARS", 1200))
+
+
+def _pieces(text: str, max_chars: int) -> list:
+    if len(text) <= max_chars:
+        return [text]
+    lines = [line for line in text.splitlines() if line.strip()]
+    parts = lines if len(lines) > 1 else _SENTENCE_RE.split(text.strip())
+    if len(parts) == 1:
+        return [text]
+    return [piece for part in parts for piece in _pieces(part, max_chars)]
+
+
+def _pack(units: list, max_chars: int) -> list:
+    stages = []
+    for unit in units:
+        if stages and len(stages[-1]) + 1 + len(unit) <= max_chars:
+            stages[-1] += "\n" + unit
+        else:
+            stages.append(unit)
+    return stages
+
+
+def split_stages(description: str, max_chars: int = 500, max_stages: int = 8) -> list:
+    """Split a description into consecutive stages of roughly ``max_chars``.
+
+    Paragraphs are kept together where possible, then lines (bullets), then
+    sentences. The budget grows until there are at most ``max_stages``.
+    """
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", description.strip()) if p.strip()]
+    stages = _pack([piece for p in paragraphs for piece in _pieces(p, max_chars)], max_chars)
+    while len(stages) > max_stages:
+        max_chars = max(max_chars + 1, math.ceil(max_chars * 1.25))
+        stages = _pack([piece for p in paragraphs for piece in _pieces(p, max_chars)], max_chars)
+    return stages
+
+
+def is_large(description: str) -> bool:
+    limit = get_large_graph_chars()
+    return bool(limit) and len(description) > limit and len(split_stages(description)) > 1
+
+
+def stage_title(stage: str, words: int = 6) -> str:
+    """Short label for a stage: the start of its first line or sentence."""
+    first = _SENTENCE_RE.split(_BULLET_RE.sub("", stage.strip().splitlines()[0]))[0]
+    title = " ".join(first.split()[:words]).strip(" .:;,-")
+    return title or "Stage"
+
+
+def outline(stages: list) -> str:
+    return "; ".join(f"{i}. {stage_title(stage)}" for i, stage in enumerate(stages, 1))
+
+
+def _renamed(scope: "Subgraph", prefix: str) -> list:
+    from dotgraph import Edge, Subgraph
+    items = []
+    for kind, item in scope.items:
+        if kind == "node":
+            item = prefix + item
+        elif kind == "edge":
+            item = Edge(prefix + item.tail, prefix + item.head, dict(item.attrs), item.tailport, item.headport)
+        elif kind == "subgraph":
+            name = item.name and (f"cluster_{prefix}{item.name[7:].lstrip('_')}" if item.is_cluster
+                                  else prefix + item.name)
+            item = Subgraph(name, dict(item.attrs), _renamed(item, prefix))
+        items.append((kind, item))
+    return items
+
+
+def _ends(stage: "Graph") -> tuple:
+    """First source and last sink of a stage, used to chain it to its neighbours."""
+    order = stage.node_ids()
+    tails = {edge.tail for edge in stage.edges()}
+    heads = {edge.head for edge in stage.edges()}
+    first = next((n for n in order if n not in heads), order[0])
+    last = next((n for n in reversed(order) if n not in tails), order[-1])
+    return first, last
+
+
+def merge_stages(stages: list, titles: list) -> "Graph":
+    """One graph with a cluster per stage graph, linked from each stage's last step
+    to the next stage's first step. Node IDs are prefixed per stage, so stages
+    may reuse names; ``None`` stands for a stage that failed and becomes a
+    single placeholder node."""
+    from dotgraph import Edge, Graph, Subgraph
+    graph = Graph(name="Flowchart")
+    previous = None
+    for index, (stage, title) in enumerate(zip(stages, titles), 1):
+        prefix = f"s{index}_"
+        if stage is None or not stage.node_ids():
+            stage = Graph(items=[("node", "stage")], nodes={"stage": {"label": title}})
+        # A stage that is a single cluster becomes the stage cluster itself
+        subgraphs = [item for kind, item in stage.items if kind == "subgraph"]
+        only = subgraphs[0] if len(subgraphs) == 1 and subgraphs[0].is_cluster else None
+        attrs = dict(only.attrs) if only else {}
+        attrs.setdefault("label", title)
+        items = []
+        for kind, item in stage.items:
+            items.extend(item.items if item is only else [(kind, item)])
+        flat = Subgraph(items=items)
+        graph.items.append(("subgraph", Subgraph(f"cluster_stage_{index}", attrs, _renamed(flat, prefix))))
+        for node in stage.node_ids():
+            attrs = dict(stage.nodes.get(node, {}))
+            attrs.setdefault("label", node)
+            graph.nodes[prefix + node] = attrs
+        first, last = _ends(stage)
+        if previous is not None:
+            graph.items.append(("edge", Edge(previous, prefix + first)))
+        previous = prefix + last
+    return graph
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+
+from config import getenv, load_env
+
+# Default model per backend, overridden by LLM_MODEL
+DEFAULT_MODELS = {
+    "gemini": "gemini-2.0-flash",
+    "openai": "gpt-4o-mini",
+    "fake": "replay",
+}
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """Sampler for a latency distribution in seconds.
+
+    ``spec`` is "fixed:S", "uniform:LOW,HIGH", "normal:MEAN,SD",
+    "lognormal:MEDIAN,SIGMA" or "exponential:MEAN". Samples are never negative.
+    """
+    name, _, args = spec.partition(":")
+    try:
+        params = [float(a) for a in args.split(",")] if args else []
+        sampler = {
+            "fixed": lambda rng, s: s,
+            "uniform": lambda rng, low, high: rng.uniform(low, high),
+            "normal": lambda rng, mean, sd: rng.gauss(mean, sd),
+            "lognormal": lambda rng, median, sigma: median * rng.lognormvariate(0, sigma),
+            "exponential": lambda rng, mean: rng.expovariate(1 / mean) if mean else 0.0,
+        }[name.strip()]
+        sampler(random.Random(0), *params)
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        raise ValueError(f"Invalid latency distribution {spec!r}") from None
+    return lambda rng: max(0.0, sampler(rng, *params))
+
+
+def _description(prompt: str) -> str:
+    match = re.search(r"Description:\s*\n(.*?)\n\s*\n", prompt, re.DOTALL)
+    return (match.group(1) if match else prompt).strip()
+
+
+def synthesize_response(description: str) -> str:
+    """A deterministic fenced DOT chart with one node per sentence of the description."""
+    steps = [s.strip() for s in re.split(r"[.;\n]+", description) if s.strip()] or ["Start"]
+    lines = ["```dot", "digraph Flowchart {", "    rankdir=LR;"]
+    for i, step in enumerate(steps):
+        label = " ".join(step.split()[:4]).replace('"', "'")
+        lines.append(f'    s{i} [label="{label}"];')
+    lines += [f"    s{i} -> s{i + 1};" for i in range(len(steps) - 1)]
+    lines += ["}", "```"]
+    return "\n".join(lines)
+
+
+def load_recordings(path: str) -> list:
+    """Recorded responses from a JSONL file of {"response": ..., "description": ...} objects."""
+    recordings = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                recordings.append(item if isinstance(item, dict) else {"response": item})
+    return recordings
+
+
+def make_fake_llm(recordings: Optional[list] = None, latency: str = "fixed:0",
+                  chunk_latency: str = "fixed:0", chunk_size: int = 40, seed: Optional[int] = None):
+    """Local chat model replaying recorded responses with simulated latency.
+
+    A recording whose description appears in the prompt is preferred;
+    otherwise one is picked by a hash of the prompt, and without
+    recordings a chart is synthesized from the description. ``latency`` is
+    the time to the first chunk and ``chunk_latency`` the delay between
+    chunks of ``chunk_size`` characters. Usage metadata estimates four
+    characters per token.
+    """
+    import asyncio
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    first_delay = parse_latency(latency)
+    chunk_delay = parse_latency(chunk_latency)
+    recordings = recordings or []
+    rng = random.Random(seed)
+
+    class FakeReplayChatModel(BaseChatModel):
+        @property
+        def _llm_type(self) -> str:
+            return "fake-replay"
+
+        def _respond(self, messages: list) -> tuple:
+            prompt = "\n".join(str(m.content) for m in messages)
+            matches = [r for r in recordings if r.get("description") and r["description"] in prompt]
+            if matches:
+                response = matches[0]["response"]
+            elif recordings:
+                index = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16) % len(recordings)
+                response = recordings[index]["response"]
+            else:
+                response = synthesize_response(_description(prompt))
+            chunks = [response[i:i + chunk_size] for i in range(0, len(response), chunk_size)] or [""]
+            # Shared generator: delays stay reproducible for a fixed seed and call order
+            delays = [first_delay(rng)] + [chunk_delay(rng) for _ in chunks[1:]]
+            usage = {
+                "input_tokens": len(prompt) // 4,
+                "output_tokens": len(response) // 4,
+                "total_tokens": len(prompt) // 4 + len(response) // 4,
+            }
+            return chunks, delays, usage
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+            chunks, delays, usage = self._respond(messages)
+            time.sleep(sum(delays))
+            return ChatResult(generations=[ChatGeneration(message=AIMessage("".join(chunks), usage_metadata=usage))])
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+            chunks, delays, usage = self._respond(messages)
+            await asyncio.sleep(sum(delays))
+            return ChatResult(generations=[ChatGeneration(message=AIMessage("".join(chunks), usage_metadata=usage))])
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator:
+            chunks, delays, usage = self._respond(messages)
+            for i, (text, delay) in enumerate(zip(chunks, delays)):
+                time.sleep(delay)
+                # Usage is reported once, on the last chunk
+                last = i == len(chunks) - 1
+                yield ChatGenerationChunk(message=AIMessageChunk(text, usage_metadata=usage if last else None))
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator:
+            chunks, delays, usage = self._respond(messages)
+            for i, (text, delay) in enumerate(zip(chunks, delays)):
+                await asyncio.sleep(delay)
+                last = i == len(chunks) - 1
+                yield ChatGenerationChunk(message=AIMessageChunk(text, usage_metadata=usage if last else None))
+
+    return FakeReplayChatModel()
+
+
+def _gemini(model: str):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    # GOOGLE_API_KEY may come from a .env file
+    load_env()
+    return ChatGoogleGenerativeAI(model=model)
+
+
+def _openai(model: str):
+    try:
+        from langchain_openai import ChatOpenAI
+    except ImportError:
+        raise RuntimeError("LLM_BACKEND=openai requires the langchain-openai package") from None
+    # OPENAI_API_KEY and OPENAI_BASE_URL select any OpenAI-compatible endpoint
+    load_env()
+    return ChatOpenAI(model=model, base_url=getenv("OPENAI_BASE_URL"))
+
+
+def _fake(model: str):
+    path = getenv("FAKE_LLM_RESPONSES")
+    seed = getenv("FAKE_LLM_SEED")
+    return make_fake_llm(
+        load_recordings(path) if path else None,
+        latency=getenv("FAKE_LLM_LATENCY", "fixed:0"),
+        chunk_latency=getenv("FAKE_LLM_CHUNK_LATENCY", "fixed:0"),
+        chunk_size=int(getenv("FAKE_LLM_CHUNK_SIZE", 40)),
+        seed=int(seed) if seed is not None else None,
+    )
+
+
+# Chat model factories selectable through LLM_BACKEND, called with the model name
+LLM_BACKENDS = {
+    "gemini": _gemini,
+    "openai": _openai,
+    "fake": _fake,
+}
+
+
+def get_backend_name() -> str:
+    backend = getenv("LLM_BACKEND", "gemini")
+    if backend not in LLM_BACKENDS:
+        raise ValueError(f"LLM_BACKEND must be one of {', '.join(LLM_BACKENDS)}, not {backend!r}")
+    return backend
+
+
+def get_model_name() -> str:
+    return getenv("LLM_MODEL") or DEFAULT_MODELS[get_backend_name()]
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Optional
+
+from config import getenv
+
+# Process-wide metrics. Recording is in memory and cheap; nothing is exported
+# until start_exporter() is called with METRICS_PORT or METRICS_FILE set.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> list:
+        with _lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}  # label key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with _lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def samples(self) -> list:
+        samples = []
+        with _lock:
+            for key, counts in self.values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    samples.append((f"{self.name}_bucket", key + (("le", le),), cumulative))
+                samples.append((f"{self.name}_count", key, cumulative))
+                samples.append((f"{self.name}_sum", key, counts[-1]))
+        return samples
+
+
+class Callback:
+    """A value read when metrics are exported, e.g. a cache's own counters."""
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float], kind: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.kind = kind
+
+    def samples(self) -> list:
+        try:
+            return [(self.name, (), float(self.fn()))]
+        except Exception:
+            return []
+
+
+def _register(cls, name: str, *args, **kwargs):
+    with _lock:
+        if name not in _metrics:
+            _metrics[name] = cls(name, *args, **kwargs)
+        return _metrics[name]
+
+
+def counter(name: str, help: str) -> Counter:
+    return _register(Counter, name, help)
+
+
+def histogram(name: str, help: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help, buckets)
+
+
+def register_callback(name: str, help: str, fn: Callable[[], float], kind: str = "gauge") -> None:
+    with _lock:
+        _metrics[name] = Callback(name, help, fn, kind)
+
+
+SPAN_SECONDS = histogram("span_duration_seconds", "Duration of instrumented operations")
+SPAN_ERRORS = counter("span_errors_total", "Instrumented operations that raised")
+
+
+@lru_cache(maxsize=None)
+def get_tracer():
+    """OpenTelemetry tracer when METRICS_OTEL=1 and the API is installed, else None."""
+    if getenv("METRICS_OTEL", "0") != "1":
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        return None
+    return trace.get_tracer("ai-flowchart-generator")
+
+
+@contextmanager
+def span(name: str, **labels):
+    """Time a block into span_duration_seconds{span=name, ...}, also as an OpenTelemetry span."""
+    tracer = get_tracer()
+    otel = tracer.start_as_current_span(name, attributes={k: str(v) for k, v in labels.items()}) if tracer else None
+    if otel is not None:
+        otel.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        SPAN_ERRORS.inc(span=name, **labels)
+        if otel is not None:
+            otel.__exit__(type(e), e, e.__traceback__)
+            otel = None
+        raise
+    finally:
+        SPAN_SECONDS.observe(time.perf_counter() - start, span=name, **labels)
+        if otel is not None:
+            otel.__exit__(None, None, None)
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        metrics = sorted(_metrics.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        samples = metric.samples()
+        if not samples:
+            continue
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in samples:
+            lines.append(f"{name}{_format_labels(key)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_stats_file(path: str) -> None:
+    """Write the metrics atomically, e.g. for the node_exporter textfile collector."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def _serve(port: int) -> None:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+
+def _write_periodically(path: str, interval: float) -> None:
+    while True:
+        try:
+            write_stats_file(path)
+        except OSError:
+            pass
+        time.sleep(interval)
+
+
+@lru_cache(maxsize=None)
+def start_exporter() -> Optional[str]:
+    """Serve /metrics on METRICS_PORT and/or rewrite METRICS_FILE every METRICS_INTERVAL seconds."""
+    started = []
+    port = getenv("METRICS_PORT")
+    if port:
+        _serve(int(port))
+        started.append(f"http://0.0.0.0:{port}/metrics")
+    path = getenv("METRICS_FILE")
+    if path:
+        interval = float(getenv("METRICS_INTERVAL", 15))
+        threading.Thread(target=_write_periodically, args=(path, interval), name="metrics-file", daemon=True).start()
+        started.append(path)
+    return ", ".join(started) or None
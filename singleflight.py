@@ -0,0 +1,134 @@
+import threading
+from concurrent.futures import CancelledError, Future
+from typing import Any, Awaitable, Callable, Optional
+
+from metrics import counter
+
+FLIGHTS = counter("singleflight_calls_total", "Coalesced calls by group and role (leader ran it, follower shared it)")
+FLIGHT_TIMEOUTS = counter("singleflight_timeouts_total", "Followers that gave up waiting for a leader")
+
+
+class Flight:
+    """One in-flight call, resolved by its leader.
+
+    Used as a context manager around the leader's work: an exception is
+    passed on to the followers, and a flight left unresolved (cancelled,
+    or an abandoned stream) is released so its followers run the call
+    themselves.
+    """
+
+    def __init__(self, group: "SingleFlight", key: str):
+        self.group = group
+        self.key = key
+        self.future = Future()
+
+    def resolve(self, value: Any = None, error: Optional[BaseException] = None) -> None:
+        self.group._forget(self)
+        if error is not None:
+            self.future.set_exception(error)
+        else:
+            self.future.set_result(value)
+
+    def __enter__(self) -> "Flight":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.future.done():
+            return
+        if isinstance(exc, Exception):
+            self.resolve(error=exc)
+        else:
+            self.group._forget(self)
+            self.future.cancel()
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key: the first caller runs the call and
+    later callers with the same key share its result instead of repeating it.
+
+    Only calls that overlap are coalesced; nothing is kept once a call ends.
+    Followers wait at most ``timeout`` seconds, then get a TimeoutError.
+    Works across threads and event loops.
+    """
+
+    def __init__(self, name: str, timeout: Optional[float] = None):
+        self.name = name
+        self.timeout = timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: str) -> tuple:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight(self, key)
+        FLIGHTS.inc(group=self.name, role="leader" if leader else "follower")
+        return flight, leader
+
+    def _forget(self, flight: Flight) -> None:
+        with self._lock:
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def _timed_out(self, timeout: float) -> TimeoutError:
+        FLIGHT_TIMEOUTS.inc(group=self.name)
+        return TimeoutError(f"Timed out after {timeout}s waiting for an identical {self.name} call")
+
+    def lead_or_wait(self, key: str, timeout: Optional[float] = None) -> tuple:
+        """(flight, None) if the caller leads and must resolve ``flight``,
+        otherwise (None, result) with the leader's result."""
+        timeout = timeout if timeout is not None else self.timeout
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                return flight, None
+            try:
+                return None, flight.future.result(timeout)
+            except CancelledError:
+                continue  # the leader gave up: try again, possibly as leader
+            except TimeoutError:
+                raise self._timed_out(timeout) from None
+
+    async def lead_or_wait_async(self, key: str, timeout: Optional[float] = None) -> tuple:
+        """Async variant of lead_or_wait."""
+        import asyncio
+        timeout = timeout if timeout is not None else self.timeout
+        while True:
+            flight, leader = self._join(key)
+            if leader:
+                return flight, None
+            # Shielded so a follower timing out does not cancel the shared future
+            waiter = asyncio.shield(asyncio.wrap_future(flight.future))
+            try:
+                return None, await asyncio.wait_for(waiter, timeout)
+            except asyncio.CancelledError:
+                if flight.future.cancelled():
+                    continue
+                raise
+            except asyncio.TimeoutError:
+                raise self._timed_out(timeout) from None
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> tuple:
+        """Run ``fn`` once for concurrent callers with the same key; returns (result, shared)."""
+        flight, result = self.lead_or_wait(key, timeout)
+        if flight is None:
+            return result, True
+        with flight:
+            result = fn()
+            flight.resolve(result)
+        return result, False
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable], timeout: Optional[float] = None) -> tuple:
+        """Async variant of do(); ``fn`` returns an awaitable."""
+        flight, result = await self.lead_or_wait_async(key, timeout)
+        if flight is None:
+            return result, True
+        with flight:
+            result = await fn()
+            flight.resolve(result)
+        return result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,108 @@
+import re
+from itertools import cycle
+
+from config import getenv
+
+# Styling rules applied locally in the compact prompt mode instead of being
+# spelled out in every prompt. Attributes the model or user set always win.
+# The DOT parser is imported on first use, keeping this module cheap to import.
+
+GRAPH_ATTRS = {
+    "rankdir": "LR", "ranksep": "0.5", "nodesep": "0.3", "size": "8,10", "ratio": "compress",
+    "splines": "true", "concentrate": "true", "bgcolor": "#f7f7f7", "fontname": "Arial",
+}
+NODE_ATTRS = {
+    "shape": "box", "style": "filled", "fillcolor": "#e0e0e0", "penwidth": "1.5",
+    "fontcolor": "#333333", "color": "#333333", "fontname": "Arial",
+}
+EDGE_ATTRS = {"fontname": "Arial", "fontsize": "8", "fontcolor": "#666666", "color": "#666666"}
+
+# (largest node count, graph fontsize, node fontsize, node margin)
+SCALES = [
+    (9, "12", "11", "0.25,0.15"),
+    (30, "11", "10", "0.2,0.1"),
+    (None, "10", "9", "0.15,0.08"),
+]
+
+CLUSTER_COLORS = [
+    (re.compile(r"\b(ui|user|interface|input|front[ -]?end|client)", re.IGNORECASE), "#d9f3ff"),
+    (re.compile(r"\b(back[ -]?end|process|server|api|engine|logic|llm|model)", re.IGNORECASE), "#fff0e0"),
+    (re.compile(r"\b(output|export|result|report|storage|download)", re.IGNORECASE), "#e6ffe6"),
+]
+EXTRA_CLUSTER_COLORS = ["#f0e6ff", "#ffe6f0"]
+
+# Layout settings for big graphs, so time to a chart stays bounded: dot
+# without edge concentration (its slowest pass) and with fewer crossing
+# minimization iterations, then a force-directed engine beyond that
+FAST_LAYOUT_ATTRS = {"concentrate": "false", "splines": "polyline", "mclimit": "0.5"}
+SCALABLE_LAYOUT_ATTRS = {"concentrate": "false", "splines": "line", "overlap": "prism"}
+
+_OUTPUT_RE = re.compile(r"\b(png|pdf|svg|csv|json|files?|export(ed)?|download(ed)?|saved?)\b", re.IGNORECASE)
+
+
+def style_graph(graph: "Graph") -> "Graph":
+    """Apply the default flowchart styling to a parsed graph, in place."""
+    count = graph.node_count()
+    _, graph_fontsize, node_fontsize, margin = next(s for s in SCALES if s[0] is None or count <= s[0])
+    for key, value in {**GRAPH_ATTRS, "fontsize": graph_fontsize}.items():
+        graph.attrs.setdefault(key, value)
+    # Defaults go first so any node/edge defaults from the model override them
+    graph.items[:0] = [
+        ("node_defaults", {**NODE_ATTRS, "fontsize": node_fontsize, "margin": margin}),
+        ("edge_defaults", dict(EDGE_ATTRS)),
+    ]
+
+    extra_colors = cycle(EXTRA_CLUSTER_COLORS)
+    for cluster in graph.clusters():
+        text = f"{cluster.name} {cluster.attrs.get('label', '')}".replace("_", " ")
+        color = next((c for pattern, c in CLUSTER_COLORS if pattern.search(text)), None)
+        cluster.attrs.setdefault("style", "filled")
+        cluster.attrs.setdefault("fillcolor", color or next(extra_colors))
+
+    # Exported files are the sinks of the flow, drawn as cylinders
+    tails = {edge.tail for edge in graph.edges()}
+    for node, attrs in graph.nodes.items():
+        if node not in tails and _OUTPUT_RE.search(attrs.get("label", node)):
+            attrs.setdefault("shape", "cylinder")
+    return graph
+
+
+def tune_layout(graph: "Graph") -> bool:
+    """Switch large graphs to faster layout settings, in place; returns whether anything changed.
+
+    Above LAYOUT_FAST_NODES nodes dot runs with FAST_LAYOUT_ATTRS; above
+    LAYOUT_ENGINE_NODES the ``layout`` attribute selects osage (graphs with
+    clusters) or sfdp, which the renderer honours.
+    """
+    count = graph.node_count()
+    fast_nodes = int(getenv("LAYOUT_FAST_NODES", 40))
+    engine_nodes = int(getenv("LAYOUT_ENGINE_NODES", 150))
+    if engine_nodes and count > engine_nodes:
+        attrs = {**SCALABLE_LAYOUT_ATTRS, "layout": "osage" if graph.clusters() else "sfdp"}
+    elif fast_nodes and count > fast_nodes:
+        attrs = FAST_LAYOUT_ATTRS
+    else:
+        return False
+    changed = {k: v for k, v in attrs.items() if graph.attrs.get(k) != v}
+    graph.attrs.update(changed)
+    return bool(changed)
+
+
+def tune_dot(dot_code: str) -> str:
+    """tune_layout for DOT code; code that does not parse or needs no change is returned as is."""
+    from dotparse import parse_dot
+    try:
+        graph = parse_dot(dot_code)
+    except ValueError:
+        return dot_code
+    return graph.to_dot() if tune_layout(graph) else dot_code
+
+
+def style_dot(dot_code: str) -> str:
+    """Style DOT code, returning it unchanged if it does not parse."""
+    from dotparse import parse_dot
+    try:
+        graph = parse_dot(dot_code)
+    except ValueError:
+        return dot_code
+    return style_graph(graph).to_dot()
@@ -0,0 +1,68 @@
+import asyncio
+import subprocess
+
+import pytest
+from starlette.testclient import TestClient
+
+import api
+import exporter
+
+
+@pytest.fixture
+def client():
+    return TestClient(api.app)
+
+
+@pytest.mark.parametrize("body", [
+    {"dot_code": "digraph { a -> b }", "format": ["png"]},
+    {"dot_code": "digraph { a -> b }", "format": {"png": 1}},
+    {"dot_code": "digraph { a -> b }", "dpi": [300]},
+    {"dot_code": "digraph { a -> b }", "dpi": True},
+    {"dot_code": ["digraph { a -> b }"]},
+])
+def test_render_rejects_wrongly_typed_fields(client, body):
+    response = client.post("/render", json=body)
+    assert response.status_code == 400, response.text
+
+
+def test_render_maps_graphviz_failures_to_422(client, monkeypatch):
+    def failing(graph_code, fmt, engine="dot", dpi=None):
+        raise subprocess.CalledProcessError(1, ["dot"], stderr=b"Error: <stdin>: syntax error in line 1\n")
+    monkeypatch.setitem(exporter.RENDER_BACKENDS, "subprocess", failing)
+    response = client.post("/render", json={"dot_code": "digraph { a -> b [label=x] }", "format": "svg"})
+    assert response.status_code == 422
+    assert "syntax error in line 1" in response.json()["error"]
+
+
+def test_render_rejects_invalid_dot(client):
+    response = client.post("/render", json={"dot_code": "digraph { a -> }"})
+    assert response.status_code == 422 and "Invalid DOT code" in response.json()["error"]
+
+
+def test_validate(client):
+    assert client.post("/validate", json={"dot_code": "digraph { a -> b }"}).json()["valid"]
+    result = client.post("/validate", json={"dot_code": "digraph { a -> b"}).json()
+    assert not result["valid"] and result["repaired"] == "digraph { a -> b\n}"
+
+
+def test_stream_slot_is_released_when_the_client_disconnects_early():
+    limiter = api.get_limiter("generate")
+
+    async def main():
+        scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+                 "method": "POST", "scheme": "http", "path": "/generate", "raw_path": b"/generate",
+                 "query_string": b"", "root_path": "", "headers": [(b"content-type", b"application/json")],
+                 "client": ("test", 1), "server": ("test", 80)}
+        messages = [{"type": "http.request", "body": b'{"description": "a login flow", "stream": true}'}]
+
+        async def send(message):
+            # The client is gone before the response even starts
+            raise OSError("connection reset")
+
+        for _ in range(limiter.limit + 1):
+            receive = iter(messages).__next__
+            with pytest.raises(Exception):
+                await api.app(scope, lambda receive=receive: asyncio.sleep(0, receive()), send)
+        return limiter._semaphore._value
+
+    assert asyncio.run(main()) == limiter.limit
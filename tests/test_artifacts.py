@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from artifacts import ArtifactStore
+from janitor import OutputJanitor
+
+SVG = b"<svg>" + b"<g/>" * 200 + b"</svg>"
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path), compression="gzip")
+
+
+def test_identical_bytes_are_stored_once(store):
+    first = store.put(SVG, "svg", name="render:a.svg")
+    second = store.put(SVG, "svg", name="render:b.svg")
+
+    assert first.digest == second.digest and second.refs == 2
+    assert store.stats()["artifacts"] == 1 and store.dedup_hits == 1
+    assert first.encoding == "gzip" and first.stored_size < first.size
+    assert store.read(first.digest) == SVG
+    assert store.read(first.digest, 5, 9) == b"<g/>"
+
+
+def test_release_deletes_after_the_last_name(store):
+    artifact = store.put(SVG, "svg", name="render:a.svg")
+    store.put(SVG, "svg", name="render:b.svg")
+
+    store.release("render:a.svg")
+    assert os.path.exists(artifact.path) and store.info(artifact.digest).refs == 1
+    store.release("render:b.svg")
+    assert not os.path.exists(artifact.path)
+    assert store.info(artifact.digest) is None and store.resolve("render:b.svg") is None
+
+
+def test_relinking_a_name_moves_its_reference(store):
+    old = store.put(b"old", "png", name="render:x.png")
+    new = store.put(b"new", "png", name="render:x.png")
+
+    assert store.resolve("render:x.png").digest == new.digest
+    assert store.info(old.digest) is None and not os.path.exists(old.path)
+
+
+def test_janitor_expiry_is_forgotten_and_a_re_export_is_stored_again(store, tmp_path):
+    janitor = OutputJanitor(str(tmp_path), max_age=60, on_delete=store.discard)
+    artifact = store.put(SVG, "svg", name="render:a.svg")
+    janitor.track(artifact.path, written_at=1)
+
+    assert janitor.run_once() == 1
+    assert store.info(artifact.digest) is None and store.resolve("render:a.svg") is None
+
+    again = store.put(SVG, "svg", name="render:a.svg")
+    assert again.digest == artifact.digest and os.path.exists(again.path)
+    assert store.read(again.digest) == SVG
+
+
+def test_put_rewrites_a_file_deleted_behind_the_index(store):
+    artifact = store.put(SVG, "svg", name="render:a.svg")
+    os.remove(artifact.path)
+
+    # The index entry and its names are dropped with the missing file
+    again = store.put(SVG, "svg", name="render:b.svg")
+    assert os.path.exists(again.path) and again.refs == 1
+    assert store.resolve("render:a.svg") is None and store.read(again.digest) == SVG
+
+
+def test_migrate_moves_legacy_files(store, tmp_path):
+    (tmp_path / "chart_1.png").write_bytes(b"png")
+    (tmp_path / "chart_2.png").write_bytes(b"png")
+    (tmp_path / "flowchart_3").write_bytes(b"digraph {}")
+
+    assert store.migrate() == 3
+    stored = {store.resolve(name).path for name in ("legacy:chart_1.png", "legacy:flowchart_3")}
+    assert {str(path) for path in tmp_path.iterdir() if path.is_file()} == stored
+    assert store.resolve("legacy:chart_2.png").refs == 2
+    assert store.read(store.resolve("legacy:flowchart_3").digest) == b"digraph {}"
+
+
+def test_uncompressed_put_replaces_a_compressed_copy(store, tmp_path):
+    janitor = OutputJanitor(str(tmp_path), max_age=60, on_delete=store.discard)
+    compressed = store.put(SVG, "svg", name="render:a.svg")
+    janitor.track(compressed.path, written_at=1)
+    plain = store.put(SVG, "svg", name="dot:a", compress=False)
+
+    assert plain.encoding == "identity" and plain.refs == 2 and not os.path.exists(compressed.path)
+    with open(plain.path, "rb") as f:
+        assert f.read() == SVG
+    # Expiring the old compressed path leaves the plain file indexed
+    janitor.run_once()
+    assert store.resolve("render:a.svg").path == plain.path
+    assert store.put(SVG, "svg").encoding == "identity"
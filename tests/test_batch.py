@@ -0,0 +1,59 @@
+import asyncio
+import json
+
+import batch
+
+
+def _fake_generate(calls: list, failures: int = 0):
+    async def agenerate_dot_code(description, generation):
+        calls.append(description)
+        if len(calls) <= failures:
+            raise RuntimeError("429 Too Many Requests")
+        return f'digraph G {{ "{description}"; }}'
+    return agenerate_dot_code
+
+
+def _run(tmp_path, monkeypatch, lines: list) -> tuple:
+    monkeypatch.setattr(batch, "agenerate_dot_code", _fake_generate([]))
+    monkeypatch.setattr(batch, "render_formats", lambda dot_code, formats, dpi: {f: b"x" for f in formats})
+    path = tmp_path / "in.jsonl"
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    results = asyncio.run(batch.run(str(path), str(tmp_path / "out"), ["png"], 200, 2, None, 2, 0))
+    with open(tmp_path / "out" / "results.jsonl", encoding="utf-8") as f:
+        return results, [json.loads(line) for line in f]
+
+
+def test_invalid_lines_fail_individually(tmp_path, monkeypatch):
+    results, rows = _run(tmp_path, monkeypatch, [
+        '"login flow"', "42", '{"id": "x"}', "not json", '{"description": "checkout"}',
+    ])
+    assert [r.ok for r in results] == [True, False, False, False, True]
+    assert [row["index"] for row in rows] == [0, 1, 2, 3, 4]
+    assert "got int" in results[1].error
+    assert "'description'" in results[2].error
+    assert results[3].error.startswith("ValueError: line 4")
+
+
+def test_duplicate_ids_are_rejected(tmp_path, monkeypatch):
+    results, _ = _run(tmp_path, monkeypatch, [
+        '{"id": "a", "description": "checkout"}', '{"id": "a", "description": "refund"}',
+    ])
+    assert results[0].ok and "duplicate id 'a'" in results[1].error
+    assert (tmp_path / "out" / "a.dot").read_text(encoding="utf-8") == 'digraph G { "checkout"; }'
+
+
+def test_backoff_releases_the_concurrency_slot(monkeypatch):
+    calls = []
+    monkeypatch.setattr(batch, "agenerate_dot_code", _fake_generate(calls, failures=1))
+
+    async def main():
+        semaphore = asyncio.Semaphore(1)
+        retrying = asyncio.create_task(batch._generate_one(0, "first", semaphore, None, 3, 10.0, 10.0))
+        while not calls:
+            await asyncio.sleep(0)
+        # The first item is sleeping before its retry; the second must not wait for it
+        second = await asyncio.wait_for(batch._generate_one(1, "second", semaphore, None, 3, 0, 0), 1)
+        retrying.cancel()
+        return second
+
+    assert asyncio.run(main()).ok
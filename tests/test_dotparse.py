@@ -0,0 +1,74 @@
+import pytest
+
+from dotparse import DotSyntaxError, parse_dot, repair_dot, tokenize
+
+VALID = [
+    'digraph G { a -> b; }',
+    'strict graph { a -- b -- c [color=red]; }',
+    'digraph Flowchart {\n  rankdir=LR;\n  node [shape=box, style="rounded,filled", fillcolor="#e0e0e0"];\n'
+    '  subgraph cluster_0 { label="Stage 1"; start -> "User Input"; }\n  "User Input" -> end [label=<<b>ok</b>>];\n}',
+    'digraph { a:n -> b:s:w; // comment\n  # preprocessor-style line\n  c /* block */ -> { d e }; }',
+]
+
+REPAIRS = [
+    ('```dot\ndigraph G {\n  a -> b;\n}\n```', 'digraph G {\n  a -> b;\n}',
+     "removed code fences or a language tag"),
+    ('dot\ndigraph G { a -> b; }', 'digraph G { a -> b; }', "removed code fences or a language tag"),
+    ('Here is your flowchart:\ndigraph G { a -> b; }', 'digraph G { a -> b; }',
+     "removed text before the graph header"),
+    ('digraph G { a -> b; }\nThis chart shows the flow.', 'digraph G { a -> b; }',
+     "removed content after the graph"),
+    ('digraph G {\ndigraph G {\n  a -> b;\n}\n}', 'digraph G {\n\n  a -> b;\n\n}', "removed a duplicate graph header"),
+    ('digraph G {\n  a -> b;\n  subgraph cluster_0 { c; ', 'digraph G {\n  a -> b;\n  subgraph cluster_0 { c;\n}}',
+     "added 2 missing closing braces"),
+    ('digraph G { a -> b; }\n}', 'digraph G { a -> b; }', "removed extra closing braces"),
+    ('digraph G {\n  a [label="Start];\n  a -> b;\n}', 'digraph G {\n  a [label="Start"];\n  a -> b;\n}',
+     "closed an unterminated string"),
+    ('digraph G {\n  a [label="Start"\n  a -> b;\n}', 'digraph G {\n  a [label="Start"]\n  a -> b;\n}',
+     "closed an attribute list"),
+    ('digraph G { a -- b; }', 'digraph G { a -> b; }', "replaced edge operator '--'"),
+    ('graph G { a -> b; }', 'digraph G { a -> b; }', "changed 'graph' to 'digraph' for directed edges"),
+    ('digraph G { a [fillcolor=#e0e0e0]; }', 'digraph G { a [fillcolor="#e0e0e0"]; }',
+     "quoted attribute value '#e0e0e0'"),
+    ('digraph G { a [label=User Input]; }', 'digraph G { a [label="User Input"]; }',
+     "quoted attribute value 'User Input'"),
+    ('digraph G { node [size=8,10]; a; }', 'digraph G { node [size="8,10"]; a; }', "quoted attribute value '8,10'"),
+    ('a -> b;\nb -> c;', 'digraph G {\na -> b;\nb -> c;\n}', "added a missing graph header"),
+]
+
+
+@pytest.mark.parametrize("dot_code", VALID)
+def test_valid_code_passes_through_unchanged(dot_code):
+    result = repair_dot(dot_code)
+    assert result == (dot_code, [], None)
+
+
+@pytest.mark.parametrize("broken, repaired, fix", REPAIRS)
+def test_repairs(broken, repaired, fix):
+    result = repair_dot(broken)
+    assert result.ok, result.error
+    assert result.dot == repaired
+    assert fix in result.fixes
+    parse_dot(result.dot)
+
+
+def test_repair_reports_what_it_cannot_fix():
+    result = repair_dot("digraph G { a -> ; }")
+    assert not result.ok and result.error
+
+
+def test_parse_reports_the_position():
+    with pytest.raises(DotSyntaxError, match=r"line 2, column"):
+        parse_dot("digraph G {\n  a -> -> b;\n}")
+
+
+def test_parse_builds_the_graph():
+    graph = parse_dot(VALID[2])
+    assert graph.directed and graph.attrs["rankdir"] == "LR"
+    assert parse_dot(graph.to_dot()).to_dot() == graph.to_dot()
+
+
+def test_tokenize_keeps_html_strings_and_comments_apart():
+    kinds = [(t.kind, t.value) for t in tokenize('a [label=<<b>x</b>>] // c\n"q\\"s"')]
+    assert ("html", "<<b>x</b>>") in kinds
+    assert ("string", '"q\\"s"') in kinds
@@ -0,0 +1,147 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import flowchart
+from cache import PromptCache
+from flowchart import DotStreamParser, clean_dot_output
+
+OUTPUTS = [
+    ('digraph G {\n  a -> b;\n}', 'digraph G {\n  a -> b;\n}'),
+    ('```dot\ndigraph G {\n  a -> b;\n}\n```', 'digraph G {\n  a -> b;\n}'),
+    ('```\ndigraph G { a -> b; }\n```\n', 'digraph G { a -> b; }'),
+    ('```graphviz digraph G { a -> b; } ```', 'digraph G { a -> b; }'),
+    ('```digraph G { a -> b; }```', 'digraph G { a -> b; }'),
+    ('  ```DOT\r\nstrict digraph { a -> b }\r\n```', 'strict digraph { a -> b }'),
+    ('digraph G { a [label="```"]; }', 'digraph G { a [label="```"]; }'),
+]
+
+
+def _stream(raw: str, sizes) -> str:
+    parser = DotStreamParser()
+    emitted, i = [], 0
+    for size in sizes:
+        emitted.append(parser.feed(raw[i:i + size]))
+        i += size
+    emitted.append(parser.feed(raw[i:]))
+    emitted.append(parser.close())
+    assert "".join(emitted) == parser.text
+    return parser.text.strip()
+
+
+@pytest.mark.parametrize("raw, cleaned", OUTPUTS)
+def test_clean_dot_output(raw, cleaned):
+    assert clean_dot_output(raw) == cleaned
+
+
+@pytest.mark.parametrize("raw, cleaned", OUTPUTS)
+def test_chunking_does_not_change_the_result(raw, cleaned):
+    assert _stream(raw, [1] * len(raw)) == cleaned
+    rng = random.Random(raw)
+    for _ in range(50):
+        assert _stream(raw, [rng.randint(1, 8) for _ in range(len(raw))]) == cleaned
+
+
+class _Message:
+    def __init__(self, content: str):
+        self.content = content
+        self.usage_metadata = {"input_tokens": 10, "output_tokens": len(content)}
+
+
+class _SlowChain:
+    """Stands in for the LLM chain: every call takes ``delay`` seconds."""
+
+    def __init__(self, code: str, delay: float = 0.3):
+        self.code = code
+        self.delay = delay
+        self.calls = 0
+
+    def invoke(self, inputs):
+        self.calls += 1
+        time.sleep(self.delay)
+        return _Message(f"```dot\n{self.code}\n```")
+
+    def stream(self, inputs):
+        self.calls += 1
+        time.sleep(self.delay)
+        for i in range(0, len(self.code), 5):
+            yield _Message(self.code[i:i + 5])
+
+    async def ainvoke(self, inputs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return _Message(self.code)
+
+    async def astream(self, inputs):
+        for chunk in self.stream(inputs):
+            yield chunk
+
+
+CODE = 'digraph G {\n  start -> end;\n}'
+
+
+@pytest.fixture
+def chain(tmp_path, monkeypatch):
+    chain = _SlowChain(CODE)
+    prompt_cache = PromptCache(str(tmp_path / "prompts.sqlite3"))
+    monkeypatch.setattr(flowchart, "get_message_chain", lambda: chain)
+    monkeypatch.setattr(flowchart, "get_prompt_cache", lambda: prompt_cache)
+    return chain
+
+
+def _description(request) -> str:
+    # Flights are process-wide: keep each test's key unique
+    return f"a flow for {request.node.name}"
+
+
+@pytest.mark.parametrize("call", [
+    lambda description, generation: flowchart.generate_dot_code(description, generation),
+    lambda description, generation: "".join(flowchart.stream_dot_code(description, generation)) and
+    generation.dot_code,
+])
+def test_concurrent_generations_make_one_llm_call(chain, request, call):
+    description = _description(request)
+    generations = [flowchart.Generation() for _ in range(4)]
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda g: call(description, g), generations))
+
+    assert chain.calls == 1
+    assert len(set(results)) == 1 and "start -> end" in results[0]
+    assert sorted(g.coalesced for g in generations) == [False, True, True, True]
+    # A second request is served from the prompt cache
+    again = flowchart.Generation()
+    assert call(description, again) == results[0] and again.cached and chain.calls == 1
+
+
+def test_async_generations_make_one_llm_call(chain, request):
+    description = _description(request)
+
+    async def main():
+        generations = [flowchart.Generation() for _ in range(3)]
+        codes = await asyncio.gather(*(flowchart.agenerate_dot_code(description, g) for g in generations))
+        streamed = "".join([f async for f in flowchart.astream_dot_code(description + " streamed")])
+        return codes, generations, streamed
+
+    codes, generations, streamed = asyncio.run(main())
+    assert chain.calls == 2
+    assert len(set(codes)) == 1 and sum(g.coalesced for g in generations) == 2
+    assert streamed == CODE
+
+
+def test_a_failed_generation_fails_its_followers(chain, request, monkeypatch):
+    def invoke(inputs):
+        chain.calls += 1
+        time.sleep(0.3)
+        raise RuntimeError("503 Service Unavailable")
+    monkeypatch.setattr(chain, "invoke", invoke)
+    description = _description(request)
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(flowchart.generate_dot_code, description) for _ in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError, match="503"):
+                future.result()
+    assert chain.calls == 1
+    assert flowchart.get_generation_flights().in_flight() == 0
@@ -0,0 +1,12 @@
+import os
+import subprocess
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "import_time.py")
+
+
+def test_import_time_budget():
+    # Fresh interpreters: an eager langchain/graphviz import or an import
+    # side effect anywhere under flowchart or exporter fails this
+    proc = subprocess.run([sys.executable, SCRIPT, "--runs", "3"], capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stdout + proc.stderr
@@ -0,0 +1,59 @@
+import os
+import time
+
+from janitor import OutputJanitor
+
+
+def _write(directory, name: str, size: int = 10) -> str:
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return path
+
+
+def test_expires_files_by_age(tmp_path):
+    deleted = []
+    janitor = OutputJanitor(str(tmp_path), max_age=60, on_delete=deleted.extend)
+    now = time.time()
+    old = _write(tmp_path, "old.png")
+    new = _write(tmp_path, "new.png")
+    janitor.track(old, written_at=now - 120)
+    janitor.track(new, written_at=now)
+
+    assert janitor.run_once(now) == 1
+    assert deleted == [old] and not os.path.exists(old) and os.path.exists(new)
+    assert janitor.run_once(now + 61) == 1
+    assert janitor.stats() == {"files": 0, "bytes": 0, "deleted": 2}
+
+
+def test_byte_quota_evicts_least_recently_used(tmp_path):
+    janitor = OutputJanitor(str(tmp_path), max_age=3600, max_bytes=25)
+    a, b, c = (_write(tmp_path, f"{name}.png") for name in "abc")
+    for path in (a, b, c):
+        janitor.track(path)
+    janitor.touch(a)
+
+    assert janitor.run_once() == 1
+    assert not os.path.exists(b) and os.path.exists(a) and os.path.exists(c)
+    assert janitor.stats()["bytes"] == 20
+
+
+def test_tracking_again_restarts_expiry(tmp_path):
+    janitor = OutputJanitor(str(tmp_path), max_age=60)
+    path = _write(tmp_path, "chart.svg")
+    now = time.time()
+    janitor.track(path, written_at=now - 50)
+    janitor.track(path)
+
+    assert janitor.run_once(now + 30) == 0
+    assert janitor.run_once(now + 61) == 1
+
+
+def test_scan_indexes_existing_files(tmp_path):
+    path = _write(tmp_path, "left.pdf")
+    os.utime(path, (time.time() - 7200,) * 2)
+    janitor = OutputJanitor(str(tmp_path), max_age=3600)
+    janitor.scan()
+
+    assert janitor.stats()["files"] == 1
+    assert janitor.run_once() == 1 and not os.path.exists(path)
@@ -0,0 +1,116 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _slow(calls: list, result="done", delay: float = 0.2):
+    def fn():
+        calls.append(threading.current_thread().name)
+        time.sleep(delay)
+        return result
+    return fn
+
+
+def test_concurrent_calls_share_one_run():
+    flights, calls = SingleFlight("test"), []
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: flights.do("key", _slow(calls)), range(8)))
+
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["done"] * 8
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert flights.in_flight() == 0
+
+
+def test_different_keys_and_later_calls_are_not_coalesced():
+    flights, calls = SingleFlight("test"), []
+    with ThreadPoolExecutor(2) as pool:
+        list(pool.map(lambda key: flights.do(key, _slow(calls)), ["a", "b"]))
+    flights.do("a", _slow(calls, delay=0))
+
+    assert len(calls) == 3
+
+
+def test_followers_get_the_leader_exception():
+    flights = SingleFlight("test")
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("boom")
+
+    with ThreadPoolExecutor(2) as pool:
+        leader = pool.submit(flights.do, "key", fail)
+        started.wait()
+        follower = pool.submit(flights.do, "key", _slow([]))
+        for future in (leader, follower):
+            with pytest.raises(ValueError, match="boom"):
+                future.result()
+    assert flights.in_flight() == 0
+
+
+def test_an_abandoned_flight_lets_a_follower_lead():
+    flights = SingleFlight("test")
+    flight, _ = flights.lead_or_wait("key")
+    result = []
+    follower = threading.Thread(target=lambda: result.append(flights.do("key", lambda: "again")))
+    follower.start()
+    time.sleep(0.1)
+    # The leader gives up without a result, e.g. a stream the client abandoned
+    flight.__exit__(GeneratorExit, GeneratorExit(), None)
+    follower.join(2)
+
+    assert result == [("again", False)]
+
+
+def test_followers_time_out():
+    flights = SingleFlight("test", timeout=0.05)
+    flight, _ = flights.lead_or_wait("key")
+    with pytest.raises(TimeoutError, match="identical test call"):
+        flights.do("key", lambda: "never")
+    flight.resolve("late")
+    assert flights.do("key", lambda: "fresh") == ("fresh", False)
+
+
+def test_async_calls_share_one_run():
+    flights, calls = SingleFlight("test"), []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def main():
+        return await asyncio.gather(*(flights.do_async("key", fn) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1 and [r for r, _ in results] == ["done"] * 5
+
+
+def test_async_follower_timing_out_does_not_cancel_the_leader():
+    flights = SingleFlight("test")
+
+    async def main():
+        leader = asyncio.create_task(flights.do_async("key", lambda: asyncio.sleep(0.1, "done")))
+        await asyncio.sleep(0)
+        with pytest.raises(TimeoutError):
+            await flights.do_async("key", lambda: asyncio.sleep(0, "other"), timeout=0.01)
+        return await leader
+
+    assert asyncio.run(main()) == ("done", False)
+
+
+def test_async_and_thread_callers_share_a_flight():
+    flights, calls = SingleFlight("test"), []
+    with ThreadPoolExecutor(1) as pool:
+        leader = pool.submit(flights.do, "key", _slow(calls))
+        time.sleep(0.05)
+        result = asyncio.run(flights.do_async("key", lambda: asyncio.sleep(0, "other")))
+        assert leader.result() == ("done", False)
+    assert result == ("done", True) and len(calls) == 1
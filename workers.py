@@ -0,0 +1,190 @@
+import multiprocessing
+import os
+import threading
+from functools import lru_cache
+from typing import Optional
+
+
+def run_graphviz(dot_code: str, fmt: str, engine: str = "dot", dpi: Optional[int] = None) -> bytes:
+    """Render with the Graphviz CLI; ``dpi`` is passed as ``-Gdpi`` rather than edited into the code.
+
+    The "nop2" engine renders a graph that already carries positions
+    (``neato -n2``) without running a layout.
+    """
+    from graphviz.backend import dot_command, execute
+    if engine == "nop2":
+        cmd = dot_command.command("neato", fmt, neato_no_op=2)
+    else:
+        cmd = dot_command.command(engine, fmt)
+    if dpi:
+        cmd.append(f"-Gdpi={dpi}")
+    return execute.run_check(cmd, input=dot_code.encode("utf-8"), capture_output=True).stdout
+
+
+def run_graphviz_formats(dot_code: str, formats, engine: str = "dot", dpi: Optional[int] = None) -> dict:
+    """Lay out once and render several formats in a single Graphviz run
+    (one ``-T``/``-o`` pair per format), returning the bytes of each."""
+    import tempfile
+    from graphviz import parameters
+    from graphviz.backend import dot_command, execute
+    parameters.verify_engine(engine, required=True)
+    with tempfile.TemporaryDirectory(prefix="graphviz-") as directory:
+        paths = {fmt: os.path.join(directory, f"output.{fmt}") for fmt in formats}
+        cmd = [dot_command.DOT_BINARY, f"-K{engine}"]
+        for fmt, path in paths.items():
+            parameters.verify_format(fmt, required=True)
+            cmd += [f"-T{fmt}", f"-o{path}"]
+        if dpi:
+            cmd.append(f"-Gdpi={dpi}")
+        execute.run_check(cmd, input=dot_code.encode("utf-8"), capture_output=True)
+        outputs = {}
+        for fmt, path in paths.items():
+            with open(path, "rb") as f:
+                outputs[fmt] = f.read()
+        return outputs
+
+
+class GraphvizError(RuntimeError):
+    """Graphviz failed to render a job, e.g. because it rejected the DOT code."""
+
+
+@lru_cache(maxsize=None)
+def has_pygraphviz() -> bool:
+    """Whether the cgraph bindings are installed; without them the pool has nothing to offer."""
+    from importlib.util import find_spec
+    return find_spec("pygraphviz") is not None
+
+
+def _render_job(dot_code: str, fmt: str, engine: str, dpi: Optional[int] = None) -> bytes:
+    """Lay out and render one graph inside a worker process, in-process
+    through the Graphviz libraries (no ``args``: those make pygraphviz
+    shell out to the CLI)."""
+    import pygraphviz
+    graph = pygraphviz.AGraph(string=dot_code)
+    if dpi:
+        graph.graph_attr["dpi"] = str(dpi)
+    if engine == "nop2":
+        # draw() without a prog renders the existing positions
+        graph.has_layout = True
+        return graph.draw(format=fmt)
+    return graph.draw(format=fmt, prog=engine)
+
+
+def _worker_main(conn) -> None:
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        try:
+            conn.send((True, _render_job(*job)))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self, kill: bool = False) -> None:
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class GraphvizPool:
+    """Bounded pool of long-lived processes that lay out and render DOT code.
+
+    Workers keep Graphviz loaded between jobs (in-process via pygraphviz when
+    it is installed), avoiding a fork/exec of ``dot`` per render. A job that
+    exceeds ``timeout`` seconds kills its worker, and each worker is recycled
+    after ``max_jobs`` renders.
+    """
+
+    def __init__(self, processes: Optional[int] = None, max_jobs: int = 200, timeout: float = 30.0):
+        self.processes = processes or os.cpu_count() or 1
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = []
+        self._started = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def render(self, dot_code: str, fmt: str = "png", engine: str = "dot", dpi: Optional[int] = None) -> bytes:
+        worker = self._acquire()
+        finished = False
+        try:
+            worker.conn.send((dot_code, fmt, engine, dpi))
+            finished = worker.conn.poll(self.timeout)
+            if finished:
+                ok, payload = worker.conn.recv()
+        except (EOFError, OSError) as e:
+            worker.stop(kill=True)
+            worker = None
+            raise RuntimeError(f"Graphviz worker died: {e}") from e
+        finally:
+            if worker is not None and not finished:
+                worker.stop(kill=True)
+                worker = None
+            self._release(worker)
+        if not finished:
+            raise TimeoutError(f"Graphviz render exceeded {self.timeout}s")
+        if not ok:
+            raise GraphvizError(payload)
+        return payload
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+            self._cond.notify_all()
+        for worker in idle:
+            worker.stop()
+
+    def _acquire(self) -> _Worker:
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("GraphvizPool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._started < self.processes:
+                    self._started += 1
+                    break
+                self._cond.wait()
+        try:
+            return _Worker(self._ctx)
+        except Exception:
+            with self._cond:
+                self._started -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, worker: Optional[_Worker]) -> None:
+        if worker is not None:
+            worker.jobs += 1
+            if worker.jobs >= self.max_jobs or self._closed:
+                worker.stop()
+                worker = None
+        with self._cond:
+            if worker is None:
+                self._started -= 1
+            else:
+                self._idle.append(worker)
+            self._cond.notify()